@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Auto-tuning of concurrency for URL shortener
+Hill-climbs the number of worker sessions from measured throughput, errors and host headroom
+"""
+
+import time
+
+from utils import get_host_load
+from metrics import CONCURRENCY_LEVEL
+
+class ConcurrencyTuner:
+    """Starts low, adds workers while throughput rises, and keeps re-checking once settled"""
+    
+    UP = 'up'
+    DOWN = 'down'
+    SETTLED = 'settled'
+    
+    def __init__(self, logger, min_level=1, max_level=8, interval=180, tolerance=0.05,
+                 max_error_rate=0.25, max_cpu=0.85, min_free_memory_mb=1024, reprobe_every=5):
+        self.logger = logger
+        self.min_level = min_level
+        self.max_level = max_level
+        self.interval = interval
+        # Relative change in links/s that counts as better or worse rather than noise
+        self.tolerance = tolerance
+        self.max_error_rate = max_error_rate
+        self.max_cpu = max_cpu
+        self.min_free_memory_mb = min_free_memory_mb
+        # Settled intervals before probing one level higher again
+        self.reprobe_every = reprobe_every
+        
+        self.level = min_level
+        self.ceiling = max_level
+        self.mode = self.UP
+        self.throughput = {}      # level -> links/s in its latest interval
+        self.baseline = None      # links/s when the current level was settled on
+        self.settled_intervals = 0
+        
+        self.window_started = time.time()
+        self.window_successes = 0
+        self.window_failures = 0
+        CONCURRENCY_LEVEL.set(self.level)
+        get_host_load()  # First psutil CPU sample only sets the reference point
+    
+    def record(self, success):
+        if success:
+            self.window_successes += 1
+        else:
+            self.window_failures += 1
+    
+    def due(self):
+        return time.time() - self.window_started >= self.interval
+    
+    def step(self):
+        """Measure the finished interval and return the next concurrency level"""
+        elapsed = max(time.time() - self.window_started, 1e-6)
+        done = self.window_successes + self.window_failures
+        links_per_second = self.window_successes / elapsed
+        error_rate = self.window_failures / done if done else 0.0
+        cpu, available = get_host_load()
+        free_mb = available / (1024 * 1024) if available is not None else None
+        
+        self.window_started = time.time()
+        self.window_successes = 0
+        self.window_failures = 0
+        
+        previous_level = self.level
+        self.throughput[self.level] = links_per_second
+        next_level, reason = self._decide(links_per_second, error_rate, cpu, free_mb)
+        
+        cpu_text = 'unknown' if cpu is None else f'{cpu:.0%}'
+        memory_text = 'unknown' if free_mb is None else f'{free_mb:.0f} MB'
+        self.logger.info(
+            f"Auto-tune: {previous_level} workers gave {links_per_second:.3f} links/s, "
+            f"{error_rate:.0%} errors, CPU {cpu_text}, {memory_text} free - {reason}, "
+            f"{'keeping' if next_level == previous_level else 'moving to'} {next_level} workers"
+        )
+        
+        self.level = next_level
+        CONCURRENCY_LEVEL.set(self.level)
+        return self.level
+    
+    def _settle(self, level, reason):
+        self.mode = self.SETTLED
+        self.baseline = self.throughput.get(level)
+        self.settled_intervals = 0
+        return level, reason
+    
+    def _decide(self, links_per_second, error_rate, cpu, free_mb):
+        level = self.level
+        
+        # Out of headroom or the site is pushing back: step down and don't go that high again
+        # A host measure that isn't available on this platform (None) is not checked
+        cpu_high = cpu is not None and cpu > self.max_cpu
+        memory_low = free_mb is not None and free_mb < self.min_free_memory_mb
+        if error_rate > self.max_error_rate or cpu_high or memory_low:
+            self.ceiling = max(level - 1, self.min_level)
+            if error_rate > self.max_error_rate:
+                reason = f"error rate above {self.max_error_rate:.0%}"
+            elif cpu_high:
+                reason = f"CPU above {self.max_cpu:.0%}"
+            else:
+                reason = f"less than {self.min_free_memory_mb} MB free"
+            return self._settle(self.ceiling, reason)
+        
+        if self.mode == self.UP:
+            below = self.throughput.get(level - 1)
+            improved = below is None or links_per_second > below * (1 + self.tolerance)
+            if improved and level < self.ceiling:
+                return level + 1, "throughput still rising"
+            if improved:
+                return self._settle(level, "reached the ceiling")
+            return self._settle(level - 1, "no gain from the last worker")
+        
+        if self.mode == self.DOWN:
+            above = self.throughput.get(level + 1, 0)
+            if links_per_second >= above * (1 - self.tolerance) and level > self.min_level:
+                return level - 1, "same throughput with fewer workers"
+            if links_per_second >= above * (1 - self.tolerance):
+                return self._settle(level, "same throughput with fewer workers")
+            return self._settle(level + 1, "throughput fell without the last worker")
+        
+        # Settled: watch for drift, and now and then see whether one more worker helps
+        self.settled_intervals += 1
+        if self.baseline and links_per_second < self.baseline * (1 - self.tolerance):
+            if level > self.min_level:
+                self.mode = self.DOWN
+                return level - 1, "throughput dropped, trying fewer workers"
+            self.mode = self.UP
+            return min(level + 1, self.max_level), "throughput dropped, trying more workers"
+        
+        if self.settled_intervals >= self.reprobe_every and level < self.max_level:
+            self.ceiling = self.max_level
+            self.mode = self.UP
+            return level + 1, "probing one more worker"
+        
+        return level, "settled"
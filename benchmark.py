@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for URL shortener engines, result formats and link storage
+Runs the threaded and process-pool engines against a synthetic shortener that mimics
+the Python-side cost of WebDriver round trips without touching 2ad.ir, compares the
+size and write/read cost of each results file format, and measures the memory of
+front-coded link storage against plain lists and sets
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+from config import Config
+from parallel_runner import ParallelRunner
+from results_sink import RESULT_FORMATS, create_results_sink, iter_results
+from link_store import FrontCodedList, LinkSet
+
+# Shaped like a find_element/get_attribute reply; decoding and re-encoding it is the per-command CPU cost
+SAMPLE_RESPONSE = json.dumps({
+    'value': {
+        'element-6066-11e4-a52e-4f735466cecf': 'f.3A1B2C3D4E5F.d.6A7B8C9D.e.12',
+        'attributes': [{'name': f'data-attr-{i}', 'value': 'x' * 40} for i in range(40)],
+        'text': 'https://2ad.ir/' + 'a' * 200
+    }
+})
+
+class SyntheticShortener:
+    """Stands in for URLShortener: per-link JSON work plus a sleep for browser and network time"""
+    
+    def __init__(self, config, logger, results_sink=None, **kwargs):
+        self.config = config
+        self.logger = logger
+        self.results_sink = results_sink
+        self.commands = getattr(config, 'synthetic_commands', 30)
+        self.latency = getattr(config, 'synthetic_latency', 0.05)
+    
+    def setup_driver(self):
+        return True
+    
+    def login(self):
+        return True
+    
+    def _command(self, name, url):
+        request = json.dumps({'using': 'id', 'value': name, 'url': url})
+        response = json.loads(SAMPLE_RESPONSE)
+        self.logger.debug(f"{name} {len(request)} -> {len(response['value']['attributes'])}")
+        return response
+    
+    def shorten_many(self, urls, callback=None):
+        for url in urls:
+            for command in range(self.commands):
+                self._command(f'command{command}', url)
+                time.sleep(self.latency / self.commands)
+            
+            record = {
+                'timestamp': datetime.now().isoformat(),
+                'original_url': url,
+                'shortened_url': f'https://2ad.ir/{abs(hash(url)) % 10 ** 8}',
+                'status': 'SUCCESS'
+            }
+            self.results_sink.write(record)
+            yield record
+    
+    def cleanup(self):
+        pass
+
+def benchmark_engines(args, logger):
+    """Links per second for thread and process workers at each worker count"""
+    links = [f'https://example.com/file/{i}' for i in range(args.links)]
+    results = []
+    
+    for workers in args.workers:
+        for use_processes in (False, True):
+            with tempfile.TemporaryDirectory() as output_dir:
+                config = Config(username='benchmark', password='benchmark', output_dir=output_dir,
+                                batch_size=args.chunk_size, delay=0)
+                config.synthetic_commands = args.commands
+                config.synthetic_latency = args.latency
+                
+                runner = ParallelRunner(config, logger, workers=workers, use_processes=use_processes,
+                                        shortener_class=SyntheticShortener)
+                cpu_started = time.process_time()
+                started = time.perf_counter()
+                runner.process(links)
+                elapsed = time.perf_counter() - started
+                runner.results_sink.close()
+            
+            result = {
+                'engine': 'processes' if use_processes else 'threads',
+                'workers': workers,
+                'links': runner.successful,
+                'seconds': round(elapsed, 2),
+                'links_per_second': round(runner.successful / elapsed, 1),
+                'parent_cpu_seconds': round(time.process_time() - cpu_started, 2)
+            }
+            results.append(result)
+            print(f"{result['engine']:>9} x{workers:<3} {result['links']:>6} links  {result['seconds']:>7.2f}s  "
+                  f"{result['links_per_second']:>8.1f} links/s  parent CPU {result['parent_cpu_seconds']:.2f}s")
+    
+    return results
+
+def synthetic_records(count, seed=0):
+    """Result records shaped like real inputs: a few hosts and series folders, one file per episode"""
+    rng = random.Random(seed)
+    hosts = ['https://dl2.example-mirror.ir', 'https://dl5.example-mirror.ir', 'https://cdn.example-files.com']
+    series = [f'Series.Name.{i:03d}' for i in range(200)]
+    started = datetime(2025, 7, 18, 20, 0, 0)
+    
+    for i in range(count):
+        name = rng.choice(series)
+        season = rng.randint(1, 8)
+        quality = rng.choice(['480p.Web-DL', '720p.Web-DL', '1080p.BluRay'])
+        url = (f'{rng.choice(hosts)}/series/{name}/Soft.Sub/S{season:02d}/{quality}/'
+               f'{name}.S{season:02d}E{rng.randint(1, 24):02d}.{quality}.mkv')
+        success = rng.random() > 0.05
+        yield {
+            'timestamp': (started + timedelta(seconds=i * 3.1)).isoformat(),
+            'original_url': url,
+            'shortened_url': f'https://2ad.ir/{rng.getrandbits(40):010x}' if success else 'FAILED',
+            'status': 'SUCCESS' if success else 'FAILED'
+        }
+
+def benchmark_sinks(args, logger):
+    """File size and write/read time per output format"""
+    records = list(synthetic_records(args.rows))
+    results = []
+    
+    for output_format in args.formats:
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, f'results{RESULT_FORMATS[output_format]}')
+            try:
+                sink = create_results_sink(path)
+            except ImportError as e:
+                print(f"{output_format:>9}  skipped ({str(e)})")
+                continue
+            
+            started = time.perf_counter()
+            for record in records:
+                sink.write(record)
+            sink.close()
+            write_seconds = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            read_back = sum(1 for _ in iter_results(path))
+            read_seconds = time.perf_counter() - started
+            size = os.path.getsize(path)
+        
+        result = {
+            'format': output_format,
+            'rows': read_back,
+            'bytes': size,
+            'bytes_per_row': round(size / max(read_back, 1), 1),
+            'write_seconds': round(write_seconds, 3),
+            'read_seconds': round(read_seconds, 3)
+        }
+        results.append(result)
+        print(f"{output_format:>9}  {size / 1024:>10.1f} KB  {result['bytes_per_row']:>7.1f} B/row  "
+              f"write {write_seconds:>6.3f}s  read {read_seconds:>6.3f}s")
+    
+    return results
+
+def synthetic_links(count):
+    """Unique links in input-file order: one folder per series and season, episodes in sequence"""
+    hosts = ['https://dl2.example-mirror.ir', 'https://dl5.example-mirror.ir']
+    produced = 0
+    for series in range(count):
+        for season in range(1, 9):
+            for quality in ('480p.Web-DL', '720p.Web-DL', '1080p.BluRay'):
+                for episode in range(1, 25):
+                    if produced == count:
+                        return
+                    name = f'Series.Name.{series:05d}'
+                    yield (f'{hosts[series % 2]}/series/{name}/Soft.Sub/S{season:02d}/{quality}/'
+                           f'{name}.S{season:02d}E{episode:02d}.{quality}.mkv')
+                    produced += 1
+
+def benchmark_links(args, logger):
+    """Memory and speed of plain list/set against FrontCodedList/LinkSet"""
+    encoded = [link.encode('utf-8') for link in synthetic_links(args.links)]
+    probes = [link.decode('utf-8') for link in encoded[::max(len(encoded) // 20000, 1)]]
+    builders = [
+        ('list', list),
+        ('FrontCodedList', FrontCodedList),
+        ('set', set),
+        ('LinkSet', LinkSet)
+    ]
+    results = []
+    
+    for name, builder in builders:
+        # Built twice: tracemalloc slows every allocation down, so it only measures the second build
+        started = time.perf_counter()
+        container = builder(link.decode('utf-8') for link in encoded)
+        build_seconds = time.perf_counter() - started
+        del container
+        
+        tracemalloc.start()
+        container = builder(link.decode('utf-8') for link in encoded)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        
+        started = time.perf_counter()
+        if isinstance(container, (set, LinkSet)):
+            assert all(probe in container for probe in probes)
+            operation = 'lookup'
+            per_item = (time.perf_counter() - started) / len(probes)
+        else:
+            assert sum(1 for _ in container) == len(encoded)
+            operation = 'iterate'
+            per_item = (time.perf_counter() - started) / len(encoded)
+        
+        result = {
+            'container': name,
+            'links': len(container),
+            'megabytes': round(size / 1e6, 1),
+            'bytes_per_link': round(size / len(container), 1),
+            'build_seconds': round(build_seconds, 2),
+            f'{operation}_microseconds': round(per_item * 1e6, 2)
+        }
+        results.append(result)
+        print(f"{name:>15} {result['megabytes']:>8.1f} MB  {result['bytes_per_link']:>6.1f} B/link  "
+              f"build {build_seconds:>6.2f}s  {operation} {per_item * 1e6:>6.2f} us")
+        del container
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='URL shortener benchmarks')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    engines_parser = subparsers.add_parser('engines', help='Threaded vs process-pool engine throughput')
+    engines_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to try')
+    engines_parser.add_argument('--links', type=int, default=400, help='Links per run')
+    engines_parser.add_argument('--commands', type=int, default=30, help='Simulated WebDriver commands per link')
+    engines_parser.add_argument('--latency', type=float, default=0.05, help='Simulated browser/network seconds per link')
+    engines_parser.add_argument('--chunk-size', type=int, default=10, help='Links handed to a worker at a time')
+    
+    sinks_parser = subparsers.add_parser('sinks', help='Size and write/read cost of each results format')
+    sinks_parser.add_argument('--rows', type=int, default=100000, help='Result records to write')
+    sinks_parser.add_argument('--formats', nargs='+', choices=list(RESULT_FORMATS), default=list(RESULT_FORMATS),
+                              help='Formats to compare')
+    
+    links_parser = subparsers.add_parser('links', help='Memory of front-coded link storage vs list and set')
+    links_parser.add_argument('--links', type=int, default=1000000, help='Unique links to store')
+    
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger('benchmark')
+    
+    if args.command == 'engines':
+        results = benchmark_engines(args, logger)
+    elif args.command == 'sinks':
+        results = benchmark_sinks(args, logger)
+    elif args.command == 'links':
+        results = benchmark_links(args, logger)
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'command': args.command, 'cpu_count': os.cpu_count(), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker for 2ad.ir outages
+Stops taking new links after consecutive failures and probes the site with backoff
+"""
+
+import time
+import threading
+import weakref
+
+from metrics import CIRCUIT_STATE, CIRCUIT_TRIPS
+
+# Each web job or run has its own breaker, so the gauge reports the highest state among live ones
+live_breakers = weakref.WeakSet()
+CIRCUIT_STATE.set_function(lambda: max((b.STATE_VALUES[b.state] for b in list(live_breakers)), default=0))
+
+class CircuitBreaker:
+    """Shared by all workers; trips after consecutive failures or timeouts"""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+    
+    def __init__(self, logger, failure_threshold=5, timeout_threshold=3,
+                 base_backoff=15, max_backoff=600):
+        self.logger = logger
+        self.failure_threshold = failure_threshold
+        self.timeout_threshold = timeout_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_timeouts = 0
+        self.trips = 0
+        self.opened_at = None
+        self.condition = threading.Condition()
+        live_breakers.add(self)
+    
+    def _set_state(self, state):
+        self.state = state
+    
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+    
+    def record_success(self):
+        """A link went through; reset the failure streak"""
+        with self.condition:
+            self.consecutive_failures = 0
+            self.consecutive_timeouts = 0
+    
+    def record_failure(self, timeout=False):
+        """Count a failed link; returns True if this failure tripped the breaker"""
+        with self.condition:
+            if self.is_open:
+                return False
+            
+            self.consecutive_failures += 1
+            if timeout:
+                self.consecutive_timeouts += 1
+            
+            if (self.consecutive_failures >= self.failure_threshold or
+                    self.consecutive_timeouts >= self.timeout_threshold):
+                self.trips += 1
+                self.opened_at = time.time()
+                self._set_state(self.OPEN)
+                CIRCUIT_TRIPS.inc()
+                self.logger.warning(
+                    f"Circuit breaker opened after {self.consecutive_failures} consecutive failures "
+                    f"({self.consecutive_timeouts} timeouts), pausing new links"
+                )
+                return True
+            
+            return False
+    
+    def wait_until_closed(self, probe):
+        """Block until the site recovers; one caller probes with backoff while the rest wait"""
+        with self.condition:
+            if not self.is_open:
+                return
+            if self.state == self.HALF_OPEN:
+                # Another worker is already probing
+                self.condition.wait_for(lambda: not self.is_open)
+                return
+            self._set_state(self.HALF_OPEN)
+        
+        backoff = self.base_backoff
+        attempt = 0
+        while True:
+            attempt += 1
+            self.logger.info(f"Circuit breaker open, probing 2ad.ir in {backoff:.0f}s (probe #{attempt})")
+            time.sleep(backoff)
+            
+            try:
+                healthy = probe()
+            except Exception as e:
+                self.logger.warning(f"Circuit breaker probe failed: {str(e)}")
+                healthy = False
+            
+            if healthy:
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+        
+        with self.condition:
+            downtime = time.time() - self.opened_at
+            self.consecutive_failures = 0
+            self.consecutive_timeouts = 0
+            self._set_state(self.CLOSED)
+            self.condition.notify_all()
+        
+        self.logger.info(f"Circuit breaker closed after {downtime:.0f}s, resuming")
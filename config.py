@@ -7,12 +7,21 @@ Configuration management for URL shortener
 import json
 import os
 
+from utils import URL_NORMALIZATIONS, DEFAULT_URL_NORMALIZATIONS
+from results_sink import RESULT_FORMATS
+
 class Config:
     """Configuration class for URL shortener application"""
     
     def __init__(self, username=None, password=None, input_files=None, 
                  output_dir='output', batch_size=10, delay=2.0, 
-                 headless=False, resume=False):
+                 headless=False, resume=False, metrics_file=None,
+                 trace_file=None, profile=False, profile_memory=False,
+                 recycle_rss_mb=1500, recycle_after_links=500, max_link_attempts=3,
+                 max_recoveries=20, breaker_threshold=5, breaker_timeout_threshold=3,
+                 breaker_max_backoff=600, accounts_file=None, preflight=None,
+                 preflight_concurrency=32, preflight_per_host=4, preflight_timeout=10,
+                 url_normalizations=None, output_format='csv', output_path=None, max_links=1000):
         self.username = username
         self.password = password
         self.input_files = input_files or []
@@ -21,9 +30,43 @@ class Config:
         self.delay = delay
         self.headless = headless
         self.resume = resume
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.profile = profile
+        self.profile_memory = profile_memory
+        self.recycle_rss_mb = recycle_rss_mb
+        self.recycle_after_links = recycle_after_links
+        self.max_link_attempts = max_link_attempts
+        self.max_recoveries = max_recoveries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout_threshold = breaker_timeout_threshold
+        self.breaker_max_backoff = breaker_max_backoff
+        self.accounts_file = accounts_file
+        # 'skip' drops dead links before shortening, 'flag' records them as DEAD; None disables the check
+        self.preflight = preflight
+        self.preflight_concurrency = preflight_concurrency
+        self.preflight_per_host = preflight_per_host
+        self.preflight_timeout = preflight_timeout
+        # Which canonicalize_url normalizations decide that two links are the same; 'none' compares exact strings
+        self.url_normalizations = url_normalizations
+        # csv, jsonl, jsonl.gz, jsonl.zst or parquet; see results_sink.RESULT_FORMATS
+        self.output_format = output_format
+        # Explicit results file instead of a timestamped one in output_dir; '-' streams JSON lines to stdout
+        self.output_path = output_path
+        # Links taken from the input files per run; 0 takes them all
+        self.max_links = max_links
         
         # Load configuration from file if exists
         self.load_from_file()
+        
+        if self.url_normalizations is None:
+            self.url_normalizations = DEFAULT_URL_NORMALIZATIONS
+        elif isinstance(self.url_normalizations, str):
+            names = self.url_normalizations.split(',')
+            self.url_normalizations = () if self.url_normalizations == 'none' else tuple(name.strip() for name in names)
+        else:
+            # Hashable, so canonicalize_url can cache on it
+            self.url_normalizations = tuple(self.url_normalizations)
     
     def load_from_file(self, config_file='config.json'):
         """Load configuration from JSON file"""
@@ -59,8 +102,8 @@ class Config:
     
     def validate(self):
         """Validate configuration parameters"""
-        if not self.username or not self.password:
-            raise ValueError("Username and password are required")
+        if not self.accounts_file and (not self.username or not self.password):
+            raise ValueError("Username and password (or an accounts file) are required")
         
         if not self.input_files:
             raise ValueError("At least one input file is required")
@@ -71,4 +114,20 @@ class Config:
         if self.delay < 0:
             raise ValueError("Delay cannot be negative")
         
+        if self.recycle_rss_mb < 0 or self.recycle_after_links < 0:
+            raise ValueError("Driver recycling thresholds cannot be negative")
+        
+        if self.preflight not in (None, 'skip', 'flag'):
+            raise ValueError("Pre-flight mode must be 'skip' or 'flag'")
+        
+        if self.max_links < 0:
+            raise ValueError("max_links cannot be negative")
+        
+        if self.output_format not in RESULT_FORMATS:
+            raise ValueError(f"Output format must be one of: {', '.join(RESULT_FORMATS)}")
+        
+        unknown = [name for name in self.url_normalizations if name not in URL_NORMALIZATIONS]
+        if unknown:
+            raise ValueError(f"Unknown URL normalizations: {', '.join(unknown)} (choose from {', '.join(URL_NORMALIZATIONS)})")
+        
         return True
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running URL shortener daemon
+Keeps logged-in browser sessions warm and shortens links sent over a Unix socket
+
+Protocol: newline-delimited JSON. The client sends a header line such as
+{"command": "shorten"} followed by one link per line, then closes its write side.
+The daemon answers with one JSON result per link and a final {"done": true, ...} line.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import logging
+import argparse
+import tempfile
+import threading
+import socketserver
+from datetime import datetime
+
+DEFAULT_SOCKET = os.environ.get(
+    'SHORTENER_SOCKET',
+    os.path.join(tempfile.gettempdir(), f'2ad_shortener_{os.getuid()}.sock')
+)
+
+class ShortenerRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection"""
+    
+    def send(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.wfile.flush()
+    
+    def handle(self):
+        header_line = self.rfile.readline()
+        if not header_line:
+            return
+        
+        try:
+            header = json.loads(header_line)
+        except ValueError:
+            self.send({'error': 'invalid request header'})
+            return
+        
+        command = header.get('command')
+        if command == 'ping':
+            self.send({'ok': True, 'pid': os.getpid()})
+        elif command == 'stats':
+            self.send(self.server.shortener_daemon.stats())
+        elif command == 'shorten':
+            self.server.shortener_daemon.shorten_stream(header, self.iter_links(), self.send)
+        elif command == 'shutdown':
+            self.send({'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self.send({'error': f'unknown command: {command}'})
+    
+    def iter_links(self):
+        """Links as the client sends them, so long streams start before they end"""
+        for raw_line in self.rfile:
+            link = raw_line.decode('utf-8', errors='replace').strip()
+            if link and not link.startswith('#'):
+                yield link
+
+class ShortenerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, socket_path, daemon):
+        self.shortener_daemon = daemon
+        super().__init__(socket_path, ShortenerRequestHandler)
+
+class ShortenerDaemon:
+    """Serves shorten requests from a pool of warm sessions"""
+    
+    def __init__(self, logger, username=None, password=None, delay=2.0,
+                 sessions_per_account=1, idle_timeout=3600):
+        # Selenium is only needed by the server, so the client stays fast to start
+        from session_pool import SessionPool, LatencyTracker
+        
+        self.logger = logger
+        self.username = username
+        self.password = password
+        self.delay = delay
+        self.pool = SessionPool(
+            logger,
+            max_sessions_per_account=sessions_per_account,
+            idle_timeout=idle_timeout
+        )
+        self.latency = LatencyTracker()
+        self.started_at = time.time()
+        self.links_served = 0
+        self.lock = threading.Lock()
+    
+    def prewarm(self, count=1):
+        if self.username and self.password:
+            started = self.pool.prewarm(self.username, self.password, count)
+            self.logger.info(f"Prewarmed {started} session(s) for {self.username}")
+    
+    def shorten_stream(self, header, links, send):
+        """Shorten links from one connection on a single pooled session"""
+        from url_shortener import SessionLostError
+        from utils import is_valid_url
+        
+        username = header.get('username') or self.username
+        password = header.get('password') or self.password
+        if not username or not password:
+            send({'error': 'no credentials: start the daemon with --username/--password or send them'})
+            return
+        
+        started = time.time()
+        session = self.pool.acquire(username, password)
+        if session is None:
+            send({'error': f'no session available for {username}'})
+            return
+        
+        successful = 0
+        failed = 0
+        healthy = False
+        last_link_at = None
+        try:
+            for link in links:
+                if not is_valid_url(link):
+                    send({'original_url': link, 'shortened_url': None, 'status': 'invalid'})
+                    failed += 1
+                    continue
+                
+                if last_link_at is not None:
+                    wait = last_link_at + self.delay - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                
+                link_started = time.time()
+                try:
+                    shortened = session.shortener.shorten_url(link)
+                except SessionLostError:
+                    if not session.shortener.recover_session():
+                        raise
+                    shortened = session.shortener.shorten_url(link)
+                last_link_at = time.time()
+                elapsed = last_link_at - link_started
+                self.latency.record(elapsed)
+                session.links_served += 1
+                
+                if shortened:
+                    successful += 1
+                else:
+                    failed += 1
+                send({
+                    'original_url': link,
+                    'shortened_url': shortened,
+                    'status': 'success' if shortened else 'failed',
+                    'elapsed_ms': round(elapsed * 1000, 1)
+                })
+            
+            healthy = self.pool.is_healthy(session)
+        except (BrokenPipeError, ConnectionResetError):
+            self.logger.warning("Client disconnected mid-stream")
+            healthy = self.pool.is_healthy(session)
+            return
+        except Exception as e:
+            self.logger.error(f"Shorten stream failed: {str(e)}")
+            send({'error': str(e)})
+            return
+        finally:
+            self.pool.release(session, healthy)
+            with self.lock:
+                self.links_served += successful + failed
+        
+        send({
+            'done': True,
+            'successful': successful,
+            'failed': failed,
+            'elapsed_ms': round((time.time() - started) * 1000, 1)
+        })
+    
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at),
+            'links_served': self.links_served,
+            'latency': self.latency.summary(),
+            'pool': self.pool.stats()
+        }
+    
+    def shutdown(self):
+        self.pool.shutdown()
+
+def serve(args):
+    """Run the daemon until SIGTERM/SIGINT or a shutdown command"""
+    from utils import setup_logging
+    
+    logger = setup_logging(logging.DEBUG if args.verbose else logging.INFO)
+    
+    if os.path.exists(args.socket):
+        if ping(args.socket):
+            logger.error(f"A daemon is already listening on {args.socket}")
+            return 1
+        # Left over from a daemon that didn't exit cleanly
+        os.unlink(args.socket)
+    
+    daemon = ShortenerDaemon(
+        logger,
+        username=args.username,
+        password=args.password,
+        delay=args.delay,
+        sessions_per_account=args.sessions,
+        idle_timeout=args.idle_timeout
+    )
+    
+    # Only this user may talk to the socket; it accepts credentials and drives the account
+    old_umask = os.umask(0o177)
+    try:
+        server = ShortenerServer(args.socket, daemon)
+    finally:
+        os.umask(old_umask)
+    
+    def handle_signal(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    
+    daemon.prewarm(args.prewarm)
+    daemon.pool.start_maintenance()
+    logger.info(f"Shortener daemon listening on {args.socket}")
+    
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        logger.info("Shortener daemon stopped")
+    return 0
+
+def connect(socket_path, timeout=None):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    client.connect(socket_path)
+    return client
+
+def request(socket_path, header, timeout=10):
+    """Send a single-line command and return the single-line reply"""
+    with connect(socket_path, timeout) as client:
+        client.sendall((json.dumps(header) + '\n').encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        reply = client.makefile('rb').readline()
+    return json.loads(reply) if reply else None
+
+def ping(socket_path):
+    try:
+        return bool(request(socket_path, {'command': 'ping'}, timeout=2))
+    except (OSError, ValueError):
+        return False
+
+def iter_input_links(paths):
+    for path in paths:
+        if path == '-':
+            yield from sys.stdin
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                yield from f
+
+def send_links(client, header, paths):
+    """Stream the header and links to the daemon, then close the write side"""
+    try:
+        client.sendall((json.dumps(header) + '\n').encode('utf-8'))
+        for line in iter_input_links(paths):
+            line = line.strip()
+            if line:
+                client.sendall((line + '\n').encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+    except OSError:
+        # The daemon closed the connection; its error line is read by the caller
+        pass
+
+def shorten(args):
+    """Send links to the daemon and print results as they arrive"""
+    header = {'command': 'shorten'}
+    if args.username and args.password:
+        header['username'] = args.username
+        header['password'] = args.password
+    
+    sink = None
+    if args.output:
+        from results_sink import create_results_sink
+        sink = create_results_sink(args.output)
+    
+    try:
+        client = connect(args.socket)
+    except OSError as e:
+        print(f"Error: no daemon on {args.socket} ({e}); start one with: {sys.argv[0]} serve", file=sys.stderr)
+        return 1
+    
+    # Send from a thread so results can be read while links are still being sent
+    sender = threading.Thread(target=send_links, args=(client, header, args.files or ['-']), daemon=True)
+    sender.start()
+    
+    exit_code = 1
+    try:
+        for raw_line in client.makefile('rb'):
+            message = json.loads(raw_line)
+            if 'error' in message:
+                print(f"Error: {message['error']}", file=sys.stderr)
+                break
+            if message.get('done'):
+                print(f"Done: {message['successful']} successful, {message['failed']} failed "
+                      f"in {message['elapsed_ms'] / 1000:.1f}s", file=sys.stderr)
+                exit_code = 0 if message['successful'] else 1
+                break
+            
+            print(f"{message['original_url']}\t{message['shortened_url'] or message['status'].upper()}")
+            if sink is not None:
+                sink.write({
+                    'timestamp': datetime.now().isoformat(),
+                    'original_url': message['original_url'],
+                    'shortened_url': message['shortened_url'] or 'FAILED',
+                    'status': 'SUCCESS' if message['status'] == 'success' else 'FAILED'
+                })
+    finally:
+        client.close()
+        if sink is not None:
+            sink.close()
+    return exit_code
+
+def main():
+    parser = argparse.ArgumentParser(description='2ad.ir URL shortener daemon')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Unix socket path (default: {DEFAULT_SOCKET})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    serve_parser = subparsers.add_parser('serve', help='Run the daemon')
+    serve_parser.add_argument('--username', help='Default account for requests without credentials')
+    serve_parser.add_argument('--password', help='Password for the default account')
+    serve_parser.add_argument('--delay', type=float, default=2.0, help='Delay between links on one session (seconds)')
+    serve_parser.add_argument('--sessions', type=int, default=1, help='Browser sessions per account')
+    serve_parser.add_argument('--prewarm', type=int, default=1, help='Sessions to log in at startup for the default account')
+    serve_parser.add_argument('--idle-timeout', type=int, default=3600, help='Close sessions idle for this many seconds')
+    serve_parser.add_argument('--verbose', '-v', action='store_true', help='Verbose logging')
+    
+    shorten_parser = subparsers.add_parser('shorten', help='Shorten links through the daemon')
+    shorten_parser.add_argument('files', nargs='*', help="Link files, or '-' for stdin (default)")
+    shorten_parser.add_argument('--username', help='Account to use instead of the daemon default')
+    shorten_parser.add_argument('--password', help='Password for --username')
+    shorten_parser.add_argument('--output', help='Also append results to this CSV file')
+    
+    subparsers.add_parser('stats', help='Show pool state and latency')
+    subparsers.add_parser('stop', help='Stop the daemon')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'serve':
+        return serve(args)
+    if args.command == 'shorten':
+        return shorten(args)
+    
+    try:
+        reply = request(args.socket, {'command': 'shutdown' if args.command == 'stop' else 'stats'})
+    except OSError as e:
+        print(f"Error: no daemon on {args.socket} ({e})", file=sys.stderr)
+        return 1
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,6 +29,22 @@ def create_package():
         'url_shortener.py',
         'config.py',
         'utils.py',
+        'metrics.py',
+        'driver_instrumentation.py',
+        'tracing.py',
+        'profiling.py',
+        'circuit_breaker.py',
+        'multi_account.py',
+        'results_sink.py',
+        'work_queue.py',
+        'folder_watch.py',
+        'pipeline.py',
+        'parallel_runner.py',
+        'autotune.py',
+        'link_checker.py',
+        'verify_links.py',
+        'stream_runner.py',
+        'link_store.py',
         'config.json',
         'run_local.py',
         'README_FARSI.md'
@@ -57,7 +73,7 @@ def create_package():
 echo Installing 2ad.ir URL Shortener...
 echo.
 echo Installing Python dependencies...
-pip install selenium webdriver-manager
+pip install selenium webdriver-manager requests
 echo.
 echo Installation complete!
 echo.
@@ -78,7 +94,7 @@ pause
 echo "Installing 2ad.ir URL Shortener..."
 echo
 echo "Installing Python dependencies..."
-pip install selenium webdriver-manager
+pip install selenium webdriver-manager requests
 echo
 echo "Installation complete!"
 echo
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebDriver command instrumentation
+Counts and times every chromedriver round trip, per link and per run
+"""
+
+import json
+import time
+import threading
+from collections import deque
+
+from metrics import WEBDRIVER_COMMANDS, WEBDRIVER_COMMAND_SECONDS
+
+class CommandStats:
+    """Per-command counts and latencies for one URLShortener"""
+    
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.run_commands = {}      # command -> [count, total_seconds, max_seconds]
+        self.link_commands = None   # command -> count for the link in progress
+        self.link_started = None
+        self.current_link = None
+        # Pooled and daemon sessions live for days: keep running totals, and only recent links for the p95
+        self.links = deque(maxlen=window)   # round trips of the most recent finished links
+        self.link_count = 0
+        self.link_round_trips = 0
+        self.link_seconds = 0.0
+        self.min_round_trips = None
+        self.max_round_trips = None
+    
+    def record(self, command, seconds):
+        """Record one command round trip"""
+        with self.lock:
+            entry = self.run_commands.get(command)
+            if entry is None:
+                entry = self.run_commands[command] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+            
+            if self.link_commands is not None:
+                self.link_commands[command] = self.link_commands.get(command, 0) + 1
+        
+        WEBDRIVER_COMMANDS.labels(command=command).inc()
+        WEBDRIVER_COMMAND_SECONDS.labels(command=command).observe(seconds)
+    
+    def start_link(self, url):
+        """Start attributing commands to a link"""
+        with self.lock:
+            self.current_link = url
+            self.link_commands = {}
+            self.link_started = time.perf_counter()
+    
+    def end_link(self):
+        """Finish the current link and return its per-command counts"""
+        with self.lock:
+            if self.link_commands is None:
+                return {}
+            commands = self.link_commands
+            round_trips = sum(commands.values())
+            self.links.append(round_trips)
+            self.link_count += 1
+            self.link_round_trips += round_trips
+            self.link_seconds += time.perf_counter() - self.link_started
+            if self.min_round_trips is None or round_trips < self.min_round_trips:
+                self.min_round_trips = round_trips
+            if self.max_round_trips is None or round_trips > self.max_round_trips:
+                self.max_round_trips = round_trips
+            self.link_commands = None
+            self.current_link = None
+            return commands
+    
+    def summary(self):
+        """Run-level summary as a dictionary"""
+        with self.lock:
+            commands = {
+                command: {
+                    'count': count,
+                    'total_seconds': round(total, 3),
+                    'avg_ms': round(total / count * 1000, 1),
+                    'max_ms': round(maximum * 1000, 1)
+                }
+                for command, (count, total, maximum) in sorted(
+                    self.run_commands.items(), key=lambda item: item[1][1], reverse=True
+                )
+            }
+            recent = sorted(self.links)
+            link_count = self.link_count
+            summary = {
+                'links': link_count,
+                'total_commands': sum(c['count'] for c in commands.values()),
+                'commands': commands
+            }
+            if link_count:
+                summary['round_trips_per_link'] = {
+                    'avg': round(self.link_round_trips / link_count, 1),
+                    'min': self.min_round_trips,
+                    # Over the most recent links only
+                    'p95': recent[min(len(recent) - 1, int(0.95 * len(recent)))],
+                    'max': self.max_round_trips
+                }
+                summary['avg_link_seconds'] = round(self.link_seconds / link_count, 3)
+        return summary
+    
+    def log_summary(self, logger):
+        """Log a readable version of the summary"""
+        summary = self.summary()
+        logger.info(f"WebDriver commands: {summary['total_commands']} round trips for {summary['links']} links")
+        
+        if 'round_trips_per_link' in summary:
+            per_link = summary['round_trips_per_link']
+            logger.info(f"Round trips per link: avg {per_link['avg']}, p95 {per_link['p95']}, max {per_link['max']}")
+        
+        for command, stats in summary['commands'].items():
+            logger.info(f"  {command}: {stats['count']} calls, avg {stats['avg_ms']} ms, "
+                        f"max {stats['max_ms']} ms, total {stats['total_seconds']} s")
+        
+        return summary
+    
+    def save(self, path):
+        """Write the summary as JSON for benchmark comparisons"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+def instrument_driver(driver, stats):
+    """Wrap the driver's command executor so every command is recorded in stats"""
+    executor = driver.command_executor
+    original_execute = getattr(executor, '_uninstrumented_execute', executor.execute)
+    
+    def execute(command, params):
+        start = time.perf_counter()
+        try:
+            return original_execute(command, params)
+        finally:
+            stats.record(command, time.perf_counter() - start)
+    
+    executor._uninstrumented_execute = original_execute
+    executor.execute = execute
+    return driver
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watch-folder ingestion for URL shortener
+Keeps one logged-in session and shortens links as they are added to files in the input directory
+"""
+
+import os
+import time
+import glob
+import errno
+import select
+import ctypes
+import ctypes.util
+
+from metrics import QUEUE_DEPTH
+
+# inotify event bits (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+class InotifyWatcher:
+    """Wakes up when files in a directory are created, written or moved in (Linux only)"""
+    
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error), directory)
+    
+    def wait(self, timeout):
+        """Block until something changes or the timeout passes; returns True on a change"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        
+        # The events only wake us up; the caller rescans, so drain them all
+        while True:
+            try:
+                if not os.read(self.fd, 64 * 1024):
+                    break
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+        return True
+    
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class PollingWatcher:
+    """Fallback for platforms or filesystems without inotify"""
+    
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return True
+    
+    def close(self):
+        pass
+
+def create_watcher(directory, logger):
+    """inotify when available, otherwise plain polling"""
+    try:
+        watcher = InotifyWatcher(directory)
+        logger.info(f"Watching {directory} with inotify")
+        return watcher
+    except (OSError, AttributeError) as e:
+        logger.info(f"inotify unavailable ({str(e)}), polling {directory} instead")
+        return PollingWatcher()
+
+def read_new_lines(path, state, settle_seconds=5):
+    """Read links appended since the saved offset; returns (links, new_state)
+    
+    Only complete lines are consumed so a half-written link is picked up on the next scan,
+    unless the file has not changed for settle_seconds (a last line without a newline).
+    A replaced or truncated file is read again from the start.
+    """
+    stat = os.stat(path)
+    offset = state.get('offset', 0)
+    if state.get('inode') != stat.st_ino or stat.st_size < offset:
+        offset = 0
+    
+    new_state = {'offset': offset, 'inode': stat.st_ino}
+    if stat.st_size == offset:
+        return [], new_state
+    
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    
+    end = data.rfind(b'\n') + 1
+    if end < len(data) and time.time() - stat.st_mtime >= settle_seconds:
+        end = len(data)
+    
+    new_state['offset'] = offset + end
+    links = []
+    for line in data[:end].decode('utf-8', errors='replace').splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            links.append(line)
+    return links, new_state
+
+class WatchRunner:
+    """Shortens new lines from matching files in a directory until interrupted"""
+    
+    def __init__(self, config, logger, watch_dir, pattern='download_links_*.txt', poll_interval=5):
+        self.config = config
+        self.logger = logger
+        self.watch_dir = watch_dir
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.successful = 0
+        self.failed = 0
+    
+    def scan(self, shortener, processed_links):
+        """Collect unseen links from new or grown files; returns (links, offsets)"""
+        offsets = dict(shortener.file_offsets)
+        links = []
+        seen = set()
+        
+        for path in sorted(glob.glob(os.path.join(self.watch_dir, self.pattern))):
+            key = os.path.abspath(path)
+            try:
+                new_links, offsets[key] = read_new_lines(path, offsets.get(key, {}))
+            except OSError as e:
+                self.logger.warning(f"Could not read {path}: {str(e)}")
+                continue
+            
+            fresh = []
+            for link in new_links:
+                key = shortener.link_key(link)
+                if key not in processed_links and key not in seen:
+                    seen.add(key)
+                    fresh.append(link)
+            if fresh:
+                self.logger.info(f"Found {len(fresh)} new links in {path}")
+            links.extend(fresh)
+        
+        return links, offsets
+    
+    def process(self, shortener, links, processed_links):
+        """Shorten links, checkpointing every batch; returns False if the session was lost"""
+        from url_shortener import SessionLostError
+        
+        done = 0
+        try:
+            for record in shortener.shorten_many(links):
+                if record['status'] == 'success':
+                    self.successful += 1
+                else:
+                    self.failed += 1
+                processed_links.add(shortener.link_key(record['original_url']))
+                
+                done += 1
+                QUEUE_DEPTH.set(len(links) - done)
+                if done % self.config.batch_size == 0 or done == len(links):
+                    shortener.save_checkpoint(processed_links)
+                    shortener.write_metrics()
+                    self.logger.info(f"Watch mode totals - Success: {self.successful}, Failed: {self.failed}")
+        except SessionLostError as e:
+            self.logger.error(str(e))
+            shortener.save_checkpoint(processed_links)
+            return False
+        
+        return True
+    
+    def run(self):
+        """Watch the directory and shorten links until interrupted"""
+        from url_shortener import URLShortener
+        
+        shortener = URLShortener(self.config, self.logger)
+        watcher = None
+        
+        try:
+            if not shortener.setup_driver() or not shortener.login():
+                return False
+            
+            processed_links = shortener.load_checkpoint()
+            # Without the offsets a plain restart would shorten every line of every watched file again
+            if not self.config.resume:
+                shortener.load_file_offsets()
+            watcher = create_watcher(self.watch_dir, self.logger)
+            self.logger.info(f"Waiting for links in {os.path.join(self.watch_dir, self.pattern)}")
+            
+            while True:
+                links, offsets = self.scan(shortener, processed_links)
+                
+                if links:
+                    if not self.process(shortener, links, processed_links):
+                        self.logger.error("Session could not be recovered, stopping watch mode")
+                        return self.successful > 0
+                    QUEUE_DEPTH.set(0)
+                
+                # Offsets move only once their links are done, so a crash re-reads rather than skips
+                if offsets != shortener.file_offsets:
+                    shortener.file_offsets = offsets
+                    shortener.save_checkpoint(processed_links)
+                
+                if not links:
+                    watcher.wait(self.poll_interval)
+        
+        finally:
+            if watcher is not None:
+                watcher.close()
+            self.logger.info(f"Watch mode stopped: {self.successful} successful, {self.failed} failed")
+            shortener.cleanup()
+            shortener.write_metrics()
+            shortener.close_outputs()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pre-flight liveness check for links
+Probes links concurrently with HEAD or one-byte GET requests so dead mirrors never reach the browser
+"""
+
+import os
+import json
+import socket
+import logging
+import time
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import PREFLIGHT_CHECKS
+
+PROBE_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+}
+
+# Gone for good; anything else that fails is treated as unknown and still shortened
+DEAD_STATUS_CODES = (404, 410)
+
+# Servers that reject HEAD; retried with a ranged GET
+HEAD_UNSUPPORTED_CODES = (403, 405, 501)
+
+# getaddrinfo errors meaning the name does not exist; EAI_AGAIN and the like may be transient
+NAME_NOT_FOUND_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+def is_unreachable(error):
+    """True if a requests ConnectionError comes from a host that doesn't resolve or refuses connections"""
+    # SSL and proxy problems say nothing about the link itself
+    if isinstance(error, (requests.exceptions.SSLError, requests.exceptions.ProxyError)):
+        return False
+    
+    # requests wraps urllib3 errors, which wrap the socket error; walk the whole chain
+    seen = set()
+    pending = [error]
+    while pending:
+        current = pending.pop()
+        if current is None or id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, ConnectionRefusedError):
+            return True
+        if isinstance(current, socket.gaierror) and current.errno in NAME_NOT_FOUND_ERRORS:
+            return True
+        pending.extend([current.__cause__, current.__context__, getattr(current, 'reason', None)])
+        pending.extend(arg for arg in current.args if isinstance(arg, BaseException))
+    return False
+
+def create_session(pool_size, max_retries=1):
+    """requests session whose connection pool fits pool_size concurrent threads"""
+    session = requests.Session()
+    session.headers.update(PROBE_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class LinkChecker:
+    """Concurrent link prober with a pooled HTTP session, per-host limits and a result cache"""
+    
+    def __init__(self, logger, concurrency=32, per_host=4, timeout=10, cache_file=None, cache_ttl=6 * 3600):
+        self.logger = logger
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        
+        self.session = create_session(concurrency)
+        
+        self.host_limits = {}
+        self.lock = threading.Lock()
+        self.cache = self._load_cache()
+    
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            now = time.time()
+            return {url: result for url, result in cache.items()
+                    if result['alive'] is not None and now - result['checked_at'] < self.cache_ttl}
+        except Exception as e:
+            self.logger.warning(f"Could not load link check cache: {str(e)}")
+            return {}
+    
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            with self.lock:
+                data = dict(self.cache)
+            temp_path = f'{self.cache_file}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_file)
+        except Exception as e:
+            self.logger.warning(f"Could not save link check cache: {str(e)}")
+    
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self.lock:
+            limit = self.host_limits.get(host)
+            if limit is None:
+                limit = self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return limit
+    
+    def _probe(self, url):
+        """Return (alive, status_code, reason); alive is None when the answer is inconclusive"""
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if response.status_code in HEAD_UNSUPPORTED_CODES:
+                # stream=True and an immediate close so only the headers are read
+                response = self.session.get(url, timeout=self.timeout, allow_redirects=True,
+                                            headers={'Range': 'bytes=0-0'}, stream=True)
+                response.close()
+        except requests.exceptions.Timeout:
+            return None, None, 'timeout'
+        except requests.exceptions.ConnectionError as e:
+            # Unknown hosts and refused connections mean the mirror is gone; resets, SSL and proxy errors may pass
+            if is_unreachable(e):
+                return False, None, f'unreachable: {type(e).__name__}'
+            return None, None, f'connection error: {type(e).__name__}'
+        except requests.RequestException as e:
+            return None, None, str(e)
+        
+        status = response.status_code
+        if status in DEAD_STATUS_CODES:
+            return False, status, f'HTTP {status}'
+        if status < 400:
+            return True, status, f'HTTP {status}'
+        return None, status, f'HTTP {status}'
+    
+    def check(self, url):
+        """Check one link, using the cache when the last answer is recent enough"""
+        with self.lock:
+            cached = self.cache.get(url)
+        if cached is not None and time.time() - cached['checked_at'] < self.cache_ttl:
+            PREFLIGHT_CHECKS.labels(result='cached').inc()
+            return cached
+        
+        with self._host_limit(url):
+            alive, status, reason = self._probe(url)
+        
+        result = {'alive': alive, 'status': status, 'reason': reason, 'checked_at': time.time()}
+        PREFLIGHT_CHECKS.labels(result={True: 'alive', False: 'dead', None: 'unknown'}[alive]).inc()
+        # Inconclusive answers are asked again next time rather than cached
+        if alive is not None:
+            with self.lock:
+                self.cache[url] = result
+        return result
+    
+    def check_many(self, urls):
+        """Check links concurrently; returns {url: result}"""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='preflight') as executor:
+            results = dict(zip(urls, executor.map(self.check, urls)))
+        self.save_cache()
+        return results
+    
+    def split(self, urls):
+        """Split links into (usable, dead); inconclusive links count as usable"""
+        results = self.check_many(urls)
+        usable = [url for url in urls if results[url]['alive'] is not False]
+        dead = [(url, results[url]) for url in urls if results[url]['alive'] is False]
+        return usable, dead
+    
+    def close(self):
+        self.session.close()
+
+_default_checker = None
+_default_checker_lock = threading.Lock()
+
+def check_link(url, timeout=10):
+    """Check one link with a shared checker; returns the result dict"""
+    global _default_checker
+    with _default_checker_lock:
+        if _default_checker is None:
+            _default_checker = LinkChecker(logging.getLogger(__name__), timeout=timeout)
+    return _default_checker.check(url)
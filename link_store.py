@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory link storage for URL shortener
+Front-coded lists and sets for inputs that repeat the same hosts and folder prefixes
+"""
+
+import sys
+import threading
+from bisect import bisect_right
+from heapq import merge
+
+# Links per front-coded block: the first is stored whole, the rest as (shared prefix length, suffix)
+BLOCK_SIZE = 32
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _common_prefix_length(a, b):
+    # Binary search with slice comparisons: a handful of C-level compares instead of a per-byte loop
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def _decode_block(data):
+    """Yield the UTF-8 entries of one front-coded block"""
+    pos = 0
+    previous = b''
+    end = len(data)
+    while pos < end:
+        # Lengths nearly always fit in one byte; skip the general decoder for them
+        shared = data[pos]
+        if shared < 0x80:
+            pos += 1
+        else:
+            shared, pos = _decode_varint(data, pos)
+        length = data[pos]
+        if length < 0x80:
+            pos += 1
+        else:
+            length, pos = _decode_varint(data, pos)
+        previous = previous[:shared] + data[pos:pos + length]
+        pos += length
+        yield previous
+
+class _BlockWriter:
+    """Builds front-coded blocks from entries appended in order"""
+    
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = []
+        self.heads = []       # first entry of every finished block, for binary search
+        self.tail = bytearray()
+        self.tail_count = 0
+        self.last = b''
+    
+    def add(self, entry):
+        if self.tail_count == self.block_size:
+            # Publish the finished block before starting a new tail, so readers never miss entries
+            self.blocks.append(bytes(self.tail))
+            self.heads.append(next(_decode_block(self.blocks[-1])))
+            self.tail = bytearray()
+            self.tail_count = 0
+        
+        shared = _common_prefix_length(self.last, entry) if self.tail_count else 0
+        tail = self.tail
+        _encode_varint(shared, tail)
+        _encode_varint(len(entry) - shared, tail)
+        tail += entry[shared:]
+        self.tail_count += 1
+        self.last = entry
+    
+    def finish(self):
+        """All blocks, including the partly filled last one"""
+        if self.tail_count:
+            return self.blocks + [bytes(self.tail)], self.heads + [next(_decode_block(bytes(self.tail)))]
+        return list(self.blocks), list(self.heads)
+
+class FrontCodedList:
+    """Append-only list of links stored front-coded; supports len, indexing, slicing and iteration
+    
+    Consecutive links usually share everything up to the file name, so each one costs
+    little more than its last path segment. Not safe for concurrent appends.
+    """
+    
+    def __init__(self, links=(), block_size=BLOCK_SIZE):
+        self.writer = _BlockWriter(block_size)
+        self.count = 0
+        for link in links:
+            self.append(link)
+    
+    def append(self, link):
+        self.writer.add(link.encode('utf-8'))
+        self.count += 1
+    
+    def extend(self, links):
+        for link in links:
+            self.append(link)
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        count = self.count
+        blocks = self.writer.blocks
+        index = 0
+        for block in blocks[:]:
+            for entry in _decode_block(block):
+                if index == count:
+                    return
+                index += 1
+                yield entry.decode('utf-8')
+        for entry in _decode_block(bytes(self.writer.tail)):
+            if index == count:
+                return
+            index += 1
+            yield entry.decode('utf-8')
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('FrontCodedList index out of range')
+        
+        block_index, offset = divmod(index, self.writer.block_size)
+        blocks = self.writer.blocks
+        data = blocks[block_index] if block_index < len(blocks) else bytes(self.writer.tail)
+        for position, entry in enumerate(_decode_block(data)):
+            if position == offset:
+                return entry.decode('utf-8')
+        raise IndexError('FrontCodedList index out of range')
+    
+    def __repr__(self):
+        return f'FrontCodedList({self.count} links, {self.nbytes} bytes)'
+    
+    @property
+    def nbytes(self):
+        return sum(len(block) for block in self.writer.blocks) + len(self.writer.tail)
+
+class LinkSet:
+    """Set of links kept as one sorted front-coded run plus a hash set of recent additions
+    
+    Membership is a binary search over block heads and a scan of one block. The recent
+    additions are merged into the run once they reach merge_ratio of its size, so the
+    cost of merging stays linear overall.
+    """
+    
+    def __init__(self, links=(), block_size=BLOCK_SIZE, min_buffer=4096, merge_ratio=0.25):
+        self.block_size = block_size
+        self.min_buffer = min_buffer
+        self.merge_ratio = merge_ratio
+        self.blocks = []
+        self.heads = []
+        self.run_count = 0
+        self.buffer = set()
+        for link in links:
+            self.add(link)
+    
+    def _run_contains(self, entry):
+        index = bisect_right(self.heads, entry) - 1
+        if index < 0:
+            return False
+        for candidate in _decode_block(self.blocks[index]):
+            if candidate == entry:
+                return True
+            if candidate > entry:
+                return False
+        return False
+    
+    def __contains__(self, link):
+        if link in self.buffer:
+            return True
+        return bool(self.blocks) and self._run_contains(link.encode('utf-8'))
+    
+    def add(self, link):
+        """Add a link; returns False if it was already present"""
+        if link in self:
+            return False
+        self.buffer.add(link)
+        if len(self.buffer) >= max(self.min_buffer, self.run_count * self.merge_ratio):
+            self._merge()
+        return True
+    
+    def update(self, links):
+        for link in links:
+            self.add(link)
+    
+    def _iter_run(self):
+        for block in self.blocks:
+            yield from _decode_block(block)
+    
+    def _merge(self):
+        writer = _BlockWriter(self.block_size)
+        recent = sorted(link.encode('utf-8') for link in self.buffer)
+        for entry in merge(self._iter_run(), recent):
+            writer.add(entry)
+        self.blocks, self.heads = writer.finish()
+        self.run_count += len(recent)
+        self.buffer = set()
+    
+    def copy(self):
+        other = LinkSet(block_size=self.block_size, min_buffer=self.min_buffer, merge_ratio=self.merge_ratio)
+        other.blocks = list(self.blocks)
+        other.heads = list(self.heads)
+        other.run_count = self.run_count
+        other.buffer = set(self.buffer)
+        return other
+    
+    def __len__(self):
+        return self.run_count + len(self.buffer)
+    
+    def __iter__(self):
+        """Links in no particular order"""
+        for entry in self._iter_run():
+            yield entry.decode('utf-8')
+        yield from list(self.buffer)
+    
+    def __repr__(self):
+        return f'LinkSet({len(self)} links, {self.nbytes} bytes in runs)'
+    
+    @property
+    def nbytes(self):
+        return sum(len(block) for block in self.blocks)
+
+class ResultBuffer:
+    """Per-job result rows held column-wise, with the URL columns front-coded
+    
+    Rows go in and come out as dicts (original_url, shortened_url, status,
+    processed_time). One worker appends while request threads read.
+    """
+    
+    def __init__(self):
+        self.original_urls = FrontCodedList()
+        self.shortened_urls = FrontCodedList()
+        self.processed_times = FrontCodedList()
+        self.statuses = []
+        self.lock = threading.Lock()
+    
+    def append(self, row):
+        with self.lock:
+            self.original_urls.append(row['original_url'])
+            self.shortened_urls.append(row['shortened_url'])
+            self.processed_times.append(row['processed_time'])
+            # Interned, so each row only costs a list slot
+            self.statuses.append(sys.intern(str(row['status'])))
+    
+    def __len__(self):
+        return len(self.statuses)
+    
+    def __getitem__(self, index):
+        with self.lock:
+            return {
+                'original_url': self.original_urls[index],
+                'shortened_url': self.shortened_urls[index],
+                'status': self.statuses[index],
+                'processed_time': self.processed_times[index]
+            }
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def to_list(self):
+        with self.lock:
+            return [
+                {'original_url': original_url, 'shortened_url': shortened_url,
+                 'status': status, 'processed_time': processed_time}
+                for original_url, shortened_url, status, processed_time in zip(
+                    self.original_urls, self.shortened_urls, self.statuses, self.processed_times
+                )
+            ]
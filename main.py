@@ -11,35 +11,95 @@ import sys
 import logging
 from datetime import datetime
 from url_shortener import URLShortener
+from multi_account import MultiAccountRunner, load_accounts
+from work_queue import SQLiteWorkQueue, QueueWorker
+from folder_watch import WatchRunner
+from stream_runner import StreamRunner
+from pipeline import AsyncPipeline
+from parallel_runner import ParallelRunner
+from autotune import ConcurrencyTuner
+from verify_links import verify_results_file
 from config import Config
 from utils import setup_logging, validate_files
+from results_sink import RESULT_FORMATS
 
 def main():
     """Main function to run the URL shortener automation"""
     parser = argparse.ArgumentParser(description='2ad.ir URL Shortener Automation')
-    parser.add_argument('--username', required=True, help='Username for 2ad.ir')
-    parser.add_argument('--password', required=True, help='Password for 2ad.ir')
+    parser.add_argument('--username', help='Username for 2ad.ir')
+    parser.add_argument('--password', help='Password for 2ad.ir')
+    parser.add_argument('--accounts', help='Credentials file with several accounts (JSON or username:password lines)')
+    parser.add_argument('--queue', help='Shared SQLite queue file; workers on any node claim links from it')
+    parser.add_argument('--worker-id', help='Worker id in the shared queue (default: hostname-pid)')
+    parser.add_argument('--lease-seconds', type=int, default=300, help='Lease length for links claimed from the shared queue')
+    parser.add_argument('--watch', nargs='?', const='input', metavar='DIR',
+                        help='Keep running and shorten links as they are added to files in DIR (default: input)')
+    parser.add_argument('--watch-pattern', default='download_links_*.txt', help='File name pattern to watch')
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between rescans of the watched directory')
+    parser.add_argument('--pipeline', action='store_true', help='Run shortening, registration visits and writing as concurrent stages')
+    parser.add_argument('--drivers', type=int, default=2, help='Browser sessions in the shortening stage (with --pipeline)')
+    parser.add_argument('--register-workers', type=int, default=4, help='Concurrent HTTP registration visits (with --pipeline; 0 visits in the browser)')
+    parser.add_argument('--stage-queue-size', type=int, default=50, help='Capacity of the queues between pipeline stages')
+    parser.add_argument('--processes', type=int, help='Run this many browser sessions in separate worker processes')
+    parser.add_argument('--autotune', action='store_true', help='Start with one worker process and tune the count from measured throughput')
+    parser.add_argument('--max-workers', type=int, default=8, help='Upper limit for --autotune')
+    parser.add_argument('--autotune-interval', type=int, default=180, help='Seconds of measurement before each tuning decision')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help="Links files to shorten instead of --file1/--file2; '-' streams URLs from stdin")
     parser.add_argument('--file1', default='input/download_links_480p.txt', help='First links file (download_links_480p)')
     parser.add_argument('--file2', default='input/output_links.txt', help='Second links file (output_links)')
     parser.add_argument('--output-dir', default='output', help='Output directory for results')
+    parser.add_argument('--output', help="Results file (format from its extension); '-' writes JSON lines to stdout")
     parser.add_argument('--batch-size', type=int, default=10, help='Batch size for processing')
     parser.add_argument('--delay', type=float, default=2.0, help='Delay between requests (seconds)')
+    parser.add_argument('--max-links', type=int, default=1000, help='Shorten at most this many links from the input files (0 for no limit)')
     parser.add_argument('--headless', action='store_true', help='Run browser in headless mode')
     parser.add_argument('--resume', action='store_true', help='Resume from last checkpoint')
+    parser.add_argument('--metrics-file', help='Write Prometheus metrics to this file (textfile exporter)')
+    parser.add_argument('--trace', help='Write a per-link trace (Chrome trace-event JSON) to this file')
+    parser.add_argument('--profile', action='store_true', help='Profile CPU usage with cProfile')
+    parser.add_argument('--profile-memory', action='store_true', help='Report memory growth between batches with tracemalloc')
+    parser.add_argument('--recycle-rss-mb', type=int, default=1500, help='Restart Chrome between batches above this memory use in MB (0 disables)')
+    parser.add_argument('--recycle-after', type=int, default=500, help='Restart Chrome between batches after this many links (0 disables)')
+    parser.add_argument('--max-recoveries', type=int, default=20, help='Give up after this many driver crashes or expired sessions')
+    parser.add_argument('--breaker-threshold', type=int, default=5, help='Pause after this many consecutive failed links')
+    parser.add_argument('--preflight', choices=['skip', 'flag'], help='Probe links first; skip dead ones or record them as DEAD')
+    parser.add_argument('--preflight-concurrency', type=int, default=32, help='Concurrent pre-flight probes')
+    parser.add_argument('--preflight-per-host', type=int, default=4, help='Concurrent pre-flight probes per host')
+    parser.add_argument('--normalize', help='Comma-separated URL normalizations used to spot duplicate links (host,port,percent_encoding,trailing_slash,fragment) or none')
+    parser.add_argument('--output-format', default='csv', choices=list(RESULT_FORMATS), help='Results file format (jsonl.zst needs zstandard, parquet needs pyarrow)')
+    parser.add_argument('--verify', action='store_true', help='After the run, check that every short link redirects to its original URL')
+    parser.add_argument('--verify-concurrency', type=int, default=32, help='Concurrent requests when verifying short links')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose logging')
     
     args = parser.parse_args()
     
-    # Setup logging
+    if (args.queue or not args.accounts) and (not args.username or not args.password):
+        parser.error('--username and --password are required unless --accounts is given without --queue')
+    
+    # Setup logging; stdout belongs to the results when they are streamed there
     log_level = logging.DEBUG if args.verbose else logging.INFO
-    logger = setup_logging(log_level)
+    console = sys.stderr if args.output == '-' else sys.stdout
+    logger = setup_logging(log_level, stream=console)
+    
+    input_files = args.files or [args.file1, args.file2]
     
     logger.info("Starting 2ad.ir URL Shortener Automation")
-    logger.info(f"Processing files: {args.file1}, {args.file2}")
+    if args.watch:
+        logger.info(f"Watching {os.path.join(args.watch, args.watch_pattern)}")
+    else:
+        logger.info(f"Processing files: {', '.join(input_files)}")
     
     try:
+        
+        # Watch mode reads the directory itself; a node joining a shared queue doesn't need input files
+        if args.watch:
+            input_files = []
+        elif args.queue:
+            input_files = [path for path in input_files if os.path.exists(path)]
+        
         # Validate input files
-        if not validate_files([args.file1, args.file2]):
+        if not validate_files(input_files, stream=console):
             logger.error("Input file validation failed")
             return 1
         
@@ -50,18 +110,63 @@ def main():
         config = Config(
             username=args.username,
             password=args.password,
-            input_files=[args.file1, args.file2],
+            input_files=input_files,
             output_dir=args.output_dir,
             batch_size=args.batch_size,
             delay=args.delay,
             headless=args.headless,
-            resume=args.resume
+            resume=args.resume,
+            metrics_file=args.metrics_file,
+            trace_file=args.trace,
+            profile=args.profile,
+            profile_memory=args.profile_memory,
+            recycle_rss_mb=args.recycle_rss_mb,
+            recycle_after_links=args.recycle_after,
+            max_recoveries=args.max_recoveries,
+            breaker_threshold=args.breaker_threshold,
+            preflight=args.preflight,
+            preflight_concurrency=args.preflight_concurrency,
+            preflight_per_host=args.preflight_per_host,
+            url_normalizations=args.normalize,
+            output_format=args.output_format,
+            output_path=args.output,
+            max_links=args.max_links,
+            accounts_file=args.accounts
         )
         
-        # Initialize and run URL shortener
-        shortener = URLShortener(config, logger)
+        # Initialize and run URL shortener: watch mode, shared queue worker, auto-tuned or fixed process pool, staged pipeline, sharded over accounts, streamed from stdin, or single session
+        if args.watch:
+            shortener = WatchRunner(config, logger, args.watch, pattern=args.watch_pattern,
+                                    poll_interval=args.poll_interval)
+        elif args.queue:
+            queue = SQLiteWorkQueue(args.queue, lease_seconds=args.lease_seconds,
+                                    url_normalizations=config.url_normalizations)
+            shortener = QueueWorker(config, logger, queue, worker_id=args.worker_id)
+        elif args.autotune:
+            tuner = ConcurrencyTuner(logger, max_level=args.max_workers, interval=args.autotune_interval)
+            shortener = ParallelRunner(config, logger, tuner=tuner)
+        elif args.processes:
+            shortener = ParallelRunner(config, logger, workers=args.processes)
+        elif args.pipeline:
+            shortener = AsyncPipeline(config, logger, drivers=args.drivers,
+                                      register_workers=args.register_workers,
+                                      queue_size=args.stage_queue_size)
+        elif args.accounts:
+            accounts = load_accounts(args.accounts)
+            logger.info(f"Loaded {len(accounts)} accounts from {args.accounts}")
+            shortener = MultiAccountRunner(config, logger, accounts)
+        elif '-' in input_files:
+            shortener = StreamRunner(config, logger)
+        else:
+            shortener = URLShortener(config, logger)
         success = shortener.run()
         
+        if success and args.verify and getattr(shortener, 'results_file', None):
+            if shortener.results_file.endswith('.csv'):
+                verify_results_file(shortener.results_file, logger, concurrency=args.verify_concurrency)
+            else:
+                logger.warning("--verify only reads CSV results files; skipping verification")
+        
         if success:
             logger.info("URL shortening completed successfully")
             return 0
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight Prometheus-style metrics for URL shortener
+Counters, gauges and histograms rendered in the text exposition format
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+# Latency buckets in seconds, covering fast DOM steps up to slow page loads
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _format_labels(names, values, extra=None):
+    """Render a label set as {a="1",b="2"}"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """Base class handling names, help text and labelled children"""
+    
+    metric_type = 'untyped'
+    
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        
+        (registry if registry is not None else REGISTRY).register(self)
+    
+    def labels(self, *values, **kwargs):
+        """Get the child metric for one label combination"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def _unlabelled(self):
+        return self._children[()]
+    
+    def collect(self):
+        """Yield exposition lines for this metric"""
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.metric_type}'
+        for key, child in list(self._children.items()):
+            yield from self._collect_child(key, child)
+    
+    def _collect_child(self, key, child):
+        yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}'
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+    
+    def get(self):
+        return self._value
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    metric_type = 'counter'
+    
+    def _new_child(self):
+        return _CounterChild()
+    
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+    
+    def set(self, value):
+        self._value = value
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+    
+    def dec(self, amount=1):
+        self.inc(-amount)
+    
+    def set_function(self, function):
+        """Compute the value at scrape time instead of on every change"""
+        self._function = function
+    
+    def get(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return float('nan')
+        return self._value
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    
+    metric_type = 'gauge'
+    
+    def _new_child(self):
+        return _GaugeChild()
+    
+    def set(self, value):
+        self._unlabelled().set(value)
+    
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+    
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+    
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+    
+    def get(self):
+        return self._unlabelled().get()
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+    
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self.observe)
+    
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    
+    metric_type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+    
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value):
+        self._unlabelled().observe(value)
+    
+    def time(self):
+        return self._unlabelled().time()
+    
+    def _collect_child(self, key, child):
+        counts, total = child.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        labels = _format_labels(self.labelnames, key)
+        yield f'{self.name}_sum{labels} {_format_value(total)}'
+        yield f'{self.name}_count{labels} {cumulative}'
+
+class _Timer:
+    """Times a block with perf_counter and reports the elapsed seconds"""
+    
+    def __init__(self, callback):
+        self._callback = callback
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._callback(time.perf_counter() - self._start)
+        return False
+
+def timed(histogram):
+    """Decorator observing a function's run time in a histogram"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class Registry:
+    """Collection of metrics rendered together"""
+    
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+    
+    def render(self):
+        """Render all metrics in the Prometheus text format"""
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, path):
+        """Write metrics for the node_exporter textfile collector"""
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        # Replace atomically so the collector never reads a half-written file
+        os.replace(temp_path, path)
+
+REGISTRY = Registry()
+
+# Link outcome counters
+LINKS_SHORTENED = Counter('url_shortener_links_shortened_total', 'Links shortened successfully')
+LINKS_FAILED = Counter('url_shortener_links_failed_total', 'Links that could not be shortened')
+LINKS_RETRIED = Counter('url_shortener_links_retried_total', 'Links queued for another attempt')
+PREFLIGHT_CHECKS = Counter('url_shortener_preflight_checks_total', 'Pre-flight link checks by result', ['result'])
+
+# Driver lifecycle
+DRIVER_RECYCLES = Counter('url_shortener_driver_recycles_total', 'Chrome restarts between batches', ['reason'])
+SESSION_RECOVERIES = Counter('url_shortener_session_recoveries_total', 'Recoveries from a dead driver or expired login', ['cause'])
+
+# Circuit breaker
+CIRCUIT_STATE = Gauge('url_shortener_circuit_state', 'Highest circuit breaker state among running breakers (0 closed, 1 open, 2 probing)')
+CIRCUIT_TRIPS = Counter('url_shortener_circuit_trips_total', 'Times the circuit breaker opened')
+
+# Per-phase latencies
+SETUP_DRIVER_SECONDS = Histogram('url_shortener_setup_driver_seconds', 'Time to start Chrome and ChromeDriver')
+LOGIN_SECONDS = Histogram('url_shortener_login_seconds', 'Time to log in and reach the dashboard')
+SHORTEN_STEP_SECONDS = Histogram('url_shortener_shorten_step_seconds', 'Time spent in each step of shortening a link', ['step'])
+SAVE_RESULT_SECONDS = Histogram('url_shortener_save_result_seconds', 'Time to append one result row',
+                                buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+# WebDriver round trips
+WEBDRIVER_COMMANDS = Counter('url_shortener_webdriver_commands_total', 'WebDriver commands sent to ChromeDriver', ['command'])
+WEBDRIVER_COMMAND_SECONDS = Histogram('url_shortener_webdriver_command_seconds', 'WebDriver command round-trip time', ['command'],
+                                      buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0, 60.0))
+
+# Runtime state
+QUEUE_DEPTH = Gauge('url_shortener_queue_depth', 'Links or jobs waiting to be processed')
+ACTIVE_DRIVERS = Gauge('url_shortener_active_drivers', 'Chrome WebDriver sessions currently running')
+CHROME_RSS_BYTES = Gauge('url_shortener_chrome_rss_bytes', 'Resident memory of ChromeDriver and Chrome processes')
+CONCURRENCY_LEVEL = Gauge('url_shortener_concurrency_level', 'Worker sessions chosen by the auto-tuner')
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-account sharding for URL shortener
+Spreads one link list over several 2ad.ir accounts, one browser session per account
+"""
+
+import copy
+import json
+import time
+import threading
+from queue import Queue, Empty
+
+from url_shortener import URLShortener
+from results_sink import create_results_sink, results_path, RESULT_FIELDS
+from link_store import LinkSet
+from tracing import create_tracer
+from metrics import QUEUE_DEPTH
+
+class Account:
+    """Credentials and limits for one 2ad.ir account"""
+    
+    def __init__(self, username, password, rate_limit=None):
+        self.username = username
+        self.password = password
+        # Maximum links per minute for this account; None means only the global delay applies
+        self.rate_limit = rate_limit
+    
+    def __repr__(self):
+        return f'Account({self.username!r})'
+
+def load_accounts(path):
+    """Load accounts from a JSON file or a text file of username:password[:rate_limit] lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    accounts = []
+    if path.endswith('.json'):
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get('accounts', [])
+        for entry in data:
+            accounts.append(Account(entry['username'], entry['password'], entry.get('rate_limit')))
+    else:
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(':')
+            if len(parts) < 2:
+                raise ValueError(f"Invalid account line in {path}: expected username:password")
+            rate_limit = float(parts[2]) if len(parts) > 2 and parts[2] else None
+            accounts.append(Account(parts[0], parts[1], rate_limit))
+    
+    if not accounts:
+        raise ValueError(f"No accounts found in {path}")
+    
+    return accounts
+
+class MultiAccountRunner:
+    """Runs one worker per account over a shared link queue"""
+    
+    def __init__(self, config, logger, accounts):
+        self.config = config
+        self.logger = logger
+        self.accounts = accounts
+        
+        results_file = config.output_path or results_path(config.output_dir, config.output_format)
+        self.results_sink = create_results_sink(results_file, RESULT_FIELDS + ['account'])
+        self.results_file = results_file
+        self.tracer = create_tracer(config.trace_file)
+        
+        # Reads the input and owns the checkpoint; never starts a browser
+        self.coordinator = URLShortener(config, logger, results_sink=self.results_sink, tracer=self.tracer)
+        
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.processed_links = LinkSet()
+        self.since_checkpoint = 0
+        self.successful = 0
+        self.failed = 0
+        self.account_stats = {}
+    
+    def _account_config(self, account):
+        account_config = copy.copy(self.config)
+        account_config.username = account.username
+        account_config.password = account.password
+        return account_config
+    
+    def _record(self, link, outcome, stats):
+        """Count a finished link and checkpoint every batch_size links"""
+        with self.lock:
+            self.processed_links.add(self.coordinator.link_key(link))
+            if outcome == 'success':
+                self.successful += 1
+                stats['successful'] += 1
+            else:
+                self.failed += 1
+                stats['failed'] += 1
+            
+            self.since_checkpoint += 1
+            QUEUE_DEPTH.set(self.queue.qsize())
+            if self.since_checkpoint >= self.config.batch_size:
+                self.since_checkpoint = 0
+                self.coordinator.save_checkpoint(self.processed_links)
+                self.coordinator.write_metrics()
+                done = len(self.processed_links)
+                self.logger.info(f"Progress: {done} processed - Success: {self.successful}, Failed: {self.failed}")
+    
+    def _worker(self, account):
+        """Take links from the shared queue until it is empty"""
+        self.tracer.name_thread(f'account {account.username}')
+        stats = self.account_stats[account.username] = {'successful': 0, 'failed': 0, 'status': 'starting'}
+        shortener = URLShortener(
+            self._account_config(account), self.logger,
+            results_sink=self.results_sink, tracer=self.tracer
+        )
+        
+        try:
+            if not shortener.setup_driver() or not shortener.login():
+                stats['status'] = 'login_failed'
+                self.logger.error(f"Account {account.username} could not log in; "
+                                  f"its share goes to the other accounts")
+                return
+            
+            stats['status'] = 'running'
+            min_interval = self.config.delay
+            if account.rate_limit:
+                min_interval = max(min_interval, 60.0 / account.rate_limit)
+            next_allowed = 0
+            links_done = 0
+            
+            while True:
+                # A throttled account stops taking links; the others keep draining the queue
+                if shortener.circuit_breaker.is_open:
+                    stats['status'] = 'throttled'
+                    self.logger.warning(f"Account {account.username} throttled, rebalancing to other accounts")
+                    shortener.wait_if_paused()
+                    stats['status'] = 'running'
+                
+                try:
+                    link, attempt = self.queue.get_nowait()
+                except Empty:
+                    break
+                
+                wait = next_allowed - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                next_allowed = time.time() + min_interval
+                
+                outcome, _ = shortener.process_link(link, attempt)
+                
+                if outcome == 'retry':
+                    self.queue.put((link, attempt + 1))
+                    continue
+                
+                if outcome == 'stop':
+                    self.queue.put((link, attempt))
+                    stats['status'] = 'stopped'
+                    self.logger.error(f"Account {account.username} lost its session; "
+                                      f"its share goes to the other accounts")
+                    return
+                
+                self._record(link, outcome, stats)
+                links_done += 1
+                
+                if links_done % self.config.batch_size == 0:
+                    recycle_reason = shortener.get_recycle_reason()
+                    if recycle_reason and not shortener.recycle_driver(recycle_reason):
+                        stats['status'] = 'stopped'
+                        return
+            
+            stats['status'] = 'finished'
+        
+        except Exception as e:
+            stats['status'] = 'failed'
+            self.logger.error(f"Worker for account {account.username} failed: {str(e)}")
+        finally:
+            shortener.cleanup()
+    
+    def run(self):
+        """Shorten all links across the configured accounts"""
+        try:
+            links = self.coordinator.read_links_from_files()
+            if not links:
+                self.logger.error("No links to process")
+                return False
+            
+            self.processed_links = self.coordinator.load_checkpoint()
+            remaining = self.coordinator.unprocessed(links, self.processed_links)
+            for link in remaining:
+                self.queue.put((link, 1))
+            
+            self.logger.info(f"Processing {len(remaining)} links with {len(self.accounts)} accounts")
+            
+            threads = []
+            for account in self.accounts:
+                thread = threading.Thread(target=self._worker, args=(account,), name=f'account-{account.username}')
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            
+            for thread in threads:
+                thread.join()
+            
+            self.coordinator.save_checkpoint(self.processed_links)
+            
+            for username, stats in self.account_stats.items():
+                self.logger.info(f"Account {username}: {stats['status']} - "
+                                 f"Success: {stats['successful']}, Failed: {stats['failed']}")
+            
+            left_over = self.queue.qsize()
+            if left_over:
+                self.logger.error(f"{left_over} links were not processed because no account could take them")
+            
+            self.logger.info(f"Processing completed: {self.successful} successful, {self.failed} failed")
+            self.logger.info(f"Results saved to: {self.results_file}")
+            
+            return self.successful > 0
+        
+        finally:
+            QUEUE_DEPTH.set(0)
+            self.coordinator.write_metrics()
+            self.results_sink.close()
+            self.tracer.close()
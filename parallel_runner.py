@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-pool engine for URL shortener
+Runs one URLShortener per process so Python-side driver overhead isn't serialized by the GIL
+"""
+
+import copy
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+from url_shortener import URLShortener, SessionLostError
+from results_sink import create_results_sink, results_path
+from link_store import LinkSet
+from metrics import QUEUE_DEPTH, LINKS_SHORTENED, LINKS_FAILED
+
+class QueueResultsSink:
+    """Results sink that sends records to the writer in the parent process"""
+    
+    def __init__(self, results_queue, path):
+        self.results_queue = results_queue
+        self.path = path
+    
+    def write(self, record):
+        self.results_queue.put(('result', record))
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+def run_worker(index, config, shortener_class, results_file, task_queue, results_queue, log_queue,
+               stop_event, current_chunk, log_level):
+    """Worker entry point: take link chunks until told to stop (runs in a child process or thread)
+    
+    current_chunk is shared memory holding the id of the chunk in hand (-1 when idle), so the
+    parent can requeue it even if this process is killed before it can report anything.
+    """
+    logger = logging.getLogger(f'url_shortener.worker{index}')
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.setLevel(log_level)
+    logger.propagate = False
+    
+    shortener = shortener_class(config, logger, results_sink=QueueResultsSink(results_queue, results_file))
+    
+    try:
+        if not shortener.setup_driver() or not shortener.login():
+            logger.error(f"Worker {index} could not start or log in")
+            return
+        
+        # stop_event retires this worker after its current chunk when the pool shrinks
+        while not stop_event.is_set():
+            task = task_queue.get()
+            if task is None:
+                break
+            
+            chunk_id, chunk = task
+            current_chunk.value = chunk_id
+            try:
+                for _ in shortener.shorten_many(chunk):
+                    pass
+            except SessionLostError as e:
+                # The parent hands the rest of the chunk, including the link in flight, to the other workers
+                logger.error(f"Worker {index} stopped: {str(e)}")
+                break
+            current_chunk.value = -1
+    
+    except Exception as e:
+        logger.error(f"Worker {index} failed: {str(e)}")
+    finally:
+        shortener.cleanup()
+        results_queue.put(('exit', index))
+
+class ParallelRunner:
+    """Hands link chunks to worker processes and writes their results in this process"""
+    
+    def __init__(self, config, logger, workers=2, use_processes=True, chunk_size=None,
+                 shortener_class=URLShortener, tuner=None, max_restarts=None):
+        self.config = config
+        self.logger = logger
+        self.workers = workers
+        # Optional ConcurrencyTuner that grows or shrinks the pool during the run
+        self.tuner = tuner
+        self.use_processes = use_processes
+        self.chunk_size = chunk_size or config.batch_size
+        self.shortener_class = shortener_class
+        # Replacements for workers that die outright; a site or input that kills every browser must not loop forever
+        self.max_restarts = max_restarts if max_restarts is not None else workers * config.max_link_attempts
+        
+        results_file = config.output_path or results_path(config.output_dir, config.output_format)
+        self.results_sink = create_results_sink(results_file)
+        self.results_file = results_file
+        # Reads the input and owns the checkpoint; never starts a browser
+        self.coordinator = URLShortener(config, logger, results_sink=self.results_sink)
+        
+        self.processed_links = LinkSet()
+        self.successful = 0
+        self.failed = 0
+        
+        self.pool = {}        # worker index -> (worker, stop_event, current_chunk) until the worker exits
+        self.retiring = set()
+        self.started = []
+        self.next_index = 1
+        self.restarts = 0
+        
+        self.chunks = {}      # chunk id -> (links, attempt)
+        self.next_chunk_id = 0
+        self.outstanding = 0
+    
+    def _worker_config(self):
+        """Per-process outputs would clobber each other, so only the parent writes them"""
+        worker_config = copy.copy(self.config)
+        worker_config.metrics_file = None
+        worker_config.trace_file = None
+        worker_config.profile = False
+        worker_config.profile_memory = False
+        return worker_config
+    
+    def _start_worker(self, task_queue, results_queue, log_queue):
+        if self.use_processes:
+            # spawn rather than fork: the parent already runs threads (log listener, metrics)
+            context = multiprocessing.get_context('spawn')
+            start, stop_event = context.Process, context.Event()
+            current_chunk = context.Value('i', -1, lock=False)
+        else:
+            start, stop_event = threading.Thread, threading.Event()
+            current_chunk = multiprocessing.Value('i', -1, lock=False)
+        
+        index = self.next_index
+        self.next_index += 1
+        worker = start(
+            target=run_worker,
+            args=(index, self._worker_config(), self.shortener_class, self.results_file, task_queue,
+                  results_queue, log_queue, stop_event, current_chunk, self.logger.getEffectiveLevel()),
+            name=f'shortener-worker-{index}',
+            daemon=True
+        )
+        worker.start()
+        self.pool[index] = (worker, stop_event, current_chunk)
+        self.started.append(worker)
+    
+    def _put_chunk(self, task_queue, links, attempt=1):
+        chunk_id = self.next_chunk_id
+        self.next_chunk_id += 1
+        self.chunks[chunk_id] = (links, attempt)
+        task_queue.put((chunk_id, links))
+    
+    def _worker_gone(self, index, task_queue):
+        """Requeue the unfinished part of the chunk a stopped worker was holding"""
+        _, _, current_chunk = self.pool.pop(index)
+        self.retiring.discard(index)
+        if current_chunk.value < 0:
+            return
+        
+        links, attempt = self.chunks.pop(current_chunk.value)
+        left = [link for link in links if self.coordinator.link_key(link) not in self.processed_links]
+        if not left:
+            return
+        
+        if attempt >= self.config.max_link_attempts:
+            # These links took down a worker every time; --resume will try them again
+            self.outstanding -= len(left)
+            QUEUE_DEPTH.set(self.outstanding)
+            self.logger.error(f"Giving up on {len(left)} links after {attempt} workers stopped on them")
+            return
+        
+        self.logger.warning(f"Requeueing {len(left)} unfinished links from worker {index}")
+        self._put_chunk(task_queue, left, attempt + 1)
+    
+    def _scale_to(self, level, queues):
+        """Start workers or retire the newest ones until `level` are active"""
+        active = sorted(index for index in self.pool if index not in self.retiring)
+        for _ in range(level - len(active)):
+            self._start_worker(*queues)
+        for index in active[level:]:
+            self.pool[index][1].set()
+            self.retiring.add(index)
+    
+    def _record(self, record):
+        """Write a result; returns False if the link already had one (a requeued link finished twice)"""
+        # Still written: the second short link exists on 2ad.ir too
+        self.results_sink.write(record)
+        if not self.processed_links.add(self.coordinator.link_key(record['original_url'])):
+            return False
+        if self.tuner is not None:
+            self.tuner.record(record['status'] == 'SUCCESS')
+        if record['status'] == 'SUCCESS':
+            self.successful += 1
+            if self.use_processes:
+                LINKS_SHORTENED.inc()
+        else:
+            self.failed += 1
+            if self.use_processes:
+                LINKS_FAILED.inc()
+        return True
+    
+    def process(self, links):
+        """Shorten links with the worker pool; the only writer of results and checkpoints"""
+        if self.use_processes:
+            context = multiprocessing.get_context('spawn')
+            task_queue, results_queue, log_queue = context.Queue(), context.Queue(), context.Queue()
+        else:
+            task_queue, results_queue, log_queue = queue.Queue(), queue.Queue(), queue.Queue()
+        
+        handlers = list(dict.fromkeys(self.logger.handlers + logging.getLogger().handlers))
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        
+        # Chunks are taken as workers free up, so a slow session doesn't hold a fixed share
+        for i in range(0, len(links), self.chunk_size):
+            self._put_chunk(task_queue, links[i:i + self.chunk_size])
+        
+        queues = (task_queue, results_queue, log_queue)
+        self._scale_to(self.tuner.level if self.tuner else self.workers, queues)
+        self.outstanding = len(links)
+        since_checkpoint = 0
+        stopping = False
+        last_liveness_check = time.time()
+        
+        try:
+            while self.pool:
+                if self.outstanding == 0 and not stopping:
+                    stopping = True
+                    for _ in self.pool:
+                        task_queue.put(None)
+                
+                if self.tuner is not None and not stopping and self.tuner.due():
+                    self._scale_to(self.tuner.step(), queues)
+                
+                # A process killed outright never reports its exit, and the others may keep the queue busy
+                if self.use_processes and time.time() - last_liveness_check >= 5:
+                    last_liveness_check = time.time()
+                    for index, (worker, _, _) in list(self.pool.items()):
+                        if worker.is_alive():
+                            continue
+                        self.logger.error(f"Worker {index} died unexpectedly")
+                        retiring = index in self.retiring
+                        self._worker_gone(index, task_queue)
+                        if self.outstanding and not stopping and not retiring and self.restarts < self.max_restarts:
+                            self.restarts += 1
+                            self.logger.info(f"Starting a replacement worker ({self.restarts}/{self.max_restarts})")
+                            self._start_worker(*queues)
+                
+                try:
+                    kind, payload = results_queue.get(timeout=5)
+                except queue.Empty:
+                    continue
+                
+                if kind == 'result':
+                    if not self._record(payload):
+                        continue
+                    self.outstanding -= 1
+                    since_checkpoint += 1
+                    QUEUE_DEPTH.set(self.outstanding)
+                    if since_checkpoint >= self.config.batch_size:
+                        since_checkpoint = 0
+                        self.coordinator.save_checkpoint(self.processed_links)
+                        self.coordinator.write_metrics()
+                        self.logger.info(f"Progress: {len(links) - self.outstanding}/{len(links)} - "
+                                         f"Success: {self.successful}, Failed: {self.failed}")
+                elif kind == 'exit' and payload in self.pool:
+                    self._worker_gone(payload, task_queue)
+            
+            if self.outstanding:
+                self.logger.error(f"{self.outstanding} links were not processed; run again with --resume to retry them")
+        finally:
+            for worker in self.started:
+                worker.join(timeout=10)
+            listener.stop()
+            self.coordinator.save_checkpoint(self.processed_links)
+            QUEUE_DEPTH.set(0)
+    
+    def run(self):
+        """Shorten all links across the worker pool"""
+        try:
+            links = self.coordinator.read_links_from_files()
+            if not links:
+                self.logger.error("No links to process")
+                return False
+            
+            self.processed_links = self.coordinator.load_checkpoint()
+            remaining = self.coordinator.unprocessed(links, self.processed_links)
+            mode = 'processes' if self.use_processes else 'threads'
+            if self.tuner is not None:
+                self.logger.info(f"Processing {len(remaining)} links, auto-tuning between "
+                                 f"{self.tuner.min_level} and {self.tuner.max_level} worker {mode}")
+            else:
+                self.logger.info(f"Processing {len(remaining)} links with {self.workers} worker {mode}")
+            
+            self.process(remaining)
+            
+            self.logger.info(f"Processing completed: {self.successful} successful, {self.failed} failed")
+            self.logger.info(f"Results saved to: {self.results_file}")
+            return self.successful > 0
+        
+        finally:
+            self.coordinator.write_metrics()
+            self.results_sink.close()
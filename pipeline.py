@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio pipeline for URL shortener
+Runs ingestion, shortening, registration visits and result writing as concurrent stages
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from url_shortener import URLShortener, SessionLostError
+from circuit_breaker import CircuitBreaker
+from results_sink import create_results_sink, results_path
+from link_store import LinkSet
+from tracing import create_tracer
+from metrics import QUEUE_DEPTH
+
+REGISTER_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+}
+
+class StageSink:
+    """Results sink that hands records from a driver thread to the next pipeline stage
+    
+    Blocks the driver thread while the next stage's queue is full, so a slow stage
+    slows shortening down instead of buffering without limit.
+    """
+    
+    def __init__(self, loop, queue, path):
+        self.loop = loop
+        self.queue = queue
+        self.path = path
+    
+    def write(self, record):
+        asyncio.run_coroutine_threadsafe(self.queue.put(record), self.loop).result()
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+class AsyncPipeline:
+    """ingest -> shorten (driver threads) -> register (HTTP) -> write and checkpoint"""
+    
+    def __init__(self, config, logger, drivers=2, register_workers=4, queue_size=50):
+        self.config = config
+        self.logger = logger
+        self.drivers = drivers
+        # 0 keeps the registration visit in the browser tab, as the serial loop does
+        self.register_workers = register_workers
+        self.queue_size = queue_size
+        
+        results_file = config.output_path or results_path(config.output_dir, config.output_format)
+        self.results_sink = create_results_sink(results_file)
+        self.results_file = results_file
+        self.tracer = create_tracer(config.trace_file)
+        self.circuit_breaker = CircuitBreaker(
+            logger,
+            failure_threshold=config.breaker_threshold,
+            timeout_threshold=config.breaker_timeout_threshold,
+            max_backoff=config.breaker_max_backoff
+        )
+        # Reads the input and owns the checkpoint; never starts a browser
+        self.coordinator = URLShortener(config, logger, results_sink=self.results_sink, tracer=self.tracer)
+        
+        # Links taken by a driver whose session died; other drivers pick them up first
+        self.orphans = deque()
+        self.processed_links = LinkSet()
+        self.successful = 0
+        self.failed = 0
+    
+    def _pull_links(self, loop, links_queue, in_flight):
+        """Blocking iterator over the links queue for one driver thread"""
+        while True:
+            try:
+                link = self.orphans.popleft()
+            except IndexError:
+                link = asyncio.run_coroutine_threadsafe(links_queue.get(), loop).result()
+                if link is None:
+                    return
+            in_flight[0] = link
+            yield link
+    
+    def _shorten_worker(self, index, loop, links_queue, results_queue):
+        """Drive one browser session over the shared links queue (runs in the driver executor)"""
+        self.tracer.name_thread(f'driver {index}')
+        shortener = URLShortener(
+            self.config, self.logger,
+            circuit_breaker=self.circuit_breaker,
+            results_sink=StageSink(loop, results_queue, self.results_file),
+            tracer=self.tracer
+        )
+        shortener.register_in_browser = self.register_workers == 0
+        in_flight = [None]
+        
+        try:
+            if not shortener.setup_driver() or not shortener.login():
+                self.logger.error(f"Driver {index} could not start or log in")
+                return
+            
+            # Results reach the next stage through the sink; nothing to do with the records here
+            for _ in shortener.shorten_many(self._pull_links(loop, links_queue, in_flight)):
+                in_flight[0] = None
+        
+        except SessionLostError as e:
+            self.logger.error(f"Driver {index} stopped: {str(e)}")
+            if in_flight[0] is not None:
+                self.orphans.append(in_flight[0])
+        except Exception as e:
+            self.logger.error(f"Driver {index} failed: {str(e)}")
+            if in_flight[0] is not None:
+                self.orphans.append(in_flight[0])
+        finally:
+            shortener.cleanup()
+    
+    @staticmethod
+    def _visit(url):
+        """Open a short link once so 2ad.ir counts it as registered"""
+        response = requests.get(url, headers=REGISTER_HEADERS, timeout=15)
+        return response.status_code
+    
+    async def _ingest(self, links, links_queue):
+        for link in links:
+            await links_queue.put(link)
+        for _ in range(self.drivers):
+            await links_queue.put(None)
+    
+    async def _register(self, executor, results_queue, write_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await results_queue.get()
+            if record is None:
+                return
+            
+            if record['status'] == 'SUCCESS' and self.register_workers:
+                with self.tracer.span('register_http', link=record['original_url']):
+                    try:
+                        await loop.run_in_executor(executor, self._visit, record['shortened_url'])
+                    except requests.RequestException as e:
+                        self.logger.warning(f"Registration visit failed for {record['shortened_url']}: {str(e)}")
+            
+            await write_queue.put(record)
+    
+    async def _write(self, executor, write_queue, total):
+        """Write results and checkpoint every batch_size links, off the event loop thread"""
+        loop = asyncio.get_running_loop()
+        since_checkpoint = 0
+        
+        while True:
+            record = await write_queue.get()
+            if record is None:
+                break
+            
+            await loop.run_in_executor(executor, self.results_sink.write, record)
+            self.processed_links.add(self.coordinator.link_key(record['original_url']))
+            if record['status'] == 'SUCCESS':
+                self.successful += 1
+            else:
+                self.failed += 1
+            
+            since_checkpoint += 1
+            QUEUE_DEPTH.set(total - self.successful - self.failed)
+            if since_checkpoint >= self.config.batch_size:
+                since_checkpoint = 0
+                await loop.run_in_executor(executor, self.coordinator.save_checkpoint, self.processed_links.copy())
+                await loop.run_in_executor(executor, self.coordinator.write_metrics)
+                self.logger.info(f"Progress: {self.successful + self.failed}/{total} - "
+                                 f"Success: {self.successful}, Failed: {self.failed}")
+        
+        await loop.run_in_executor(executor, self.coordinator.save_checkpoint, self.processed_links.copy())
+    
+    async def run_async(self, links):
+        loop = asyncio.get_running_loop()
+        links_queue = asyncio.Queue(maxsize=self.queue_size)
+        results_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue = asyncio.Queue(maxsize=self.queue_size)
+        
+        driver_executor = ThreadPoolExecutor(max_workers=self.drivers, thread_name_prefix='driver')
+        register_executor = ThreadPoolExecutor(max_workers=max(self.register_workers, 1),
+                                               thread_name_prefix='register')
+        io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+        
+        try:
+            ingest = asyncio.create_task(self._ingest(links, links_queue))
+            registers = [
+                asyncio.create_task(self._register(register_executor, results_queue, write_queue))
+                for _ in range(max(self.register_workers, 1))
+            ]
+            writer = asyncio.create_task(self._write(io_executor, write_queue, len(links)))
+            
+            await asyncio.gather(*(
+                loop.run_in_executor(driver_executor, self._shorten_worker, index, loop, links_queue, results_queue)
+                for index in range(1, self.drivers + 1)
+            ))
+            
+            # Every driver has stopped; links still queued have nobody left to take them
+            ingest.cancel()
+            left_over = len(self.orphans) + sum(1 for link in self._drain(links_queue) if link is not None)
+            if left_over:
+                self.logger.error(f"{left_over} links were not processed because every driver stopped")
+            
+            for _ in registers:
+                await results_queue.put(None)
+            await asyncio.gather(*registers)
+            await write_queue.put(None)
+            await writer
+        finally:
+            driver_executor.shutdown(wait=False)
+            register_executor.shutdown(wait=False)
+            io_executor.shutdown(wait=True)
+    
+    @staticmethod
+    def _drain(queue):
+        while not queue.empty():
+            yield queue.get_nowait()
+    
+    def run(self):
+        """Shorten all links with the staged pipeline"""
+        try:
+            links = self.coordinator.read_links_from_files()
+            if not links:
+                self.logger.error("No links to process")
+                return False
+            
+            self.processed_links = self.coordinator.load_checkpoint()
+            remaining = self.coordinator.unprocessed(links, self.processed_links)
+            self.logger.info(f"Processing {len(remaining)} links with {self.drivers} drivers "
+                             f"and {self.register_workers} registration workers")
+            
+            asyncio.run(self.run_async(remaining))
+            
+            self.logger.info(f"Processing completed: {self.successful} successful, {self.failed} failed")
+            self.logger.info(f"Results saved to: {self.results_file}")
+            return self.successful > 0
+        
+        finally:
+            QUEUE_DEPTH.set(0)
+            self.coordinator.write_metrics()
+            self.results_sink.close()
+            self.tracer.close()
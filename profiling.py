@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profiling hooks for CLI runs
+CPU profiling with cProfile and per-batch memory growth with tracemalloc
+"""
+
+import io
+import pstats
+import cProfile
+import tracemalloc
+from datetime import datetime
+
+class RunProfiler:
+    """Collects CPU and memory profiles and writes reports next to the results"""
+    
+    def __init__(self, report_prefix, logger, cpu=False, memory=False, top=40):
+        self.report_prefix = report_prefix
+        self.logger = logger
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self.previous_snapshot = None
+    
+    @property
+    def cpu_report_file(self):
+        return f'{self.report_prefix}_profile.txt'
+    
+    @property
+    def memory_report_file(self):
+        return f'{self.report_prefix}_memory.txt'
+    
+    def profile_call(self, function, *args, **kwargs):
+        """Run a function, under cProfile if CPU profiling is enabled"""
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        
+        if not self.cpu:
+            return function(*args, **kwargs)
+        
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            self._write_cpu_report(profiler)
+    
+    def _write_cpu_report(self, profiler):
+        """Write hot functions sorted by cumulative and by own time"""
+        try:
+            profiler.dump_stats(f'{self.report_prefix}.prof')
+            
+            with open(self.cpu_report_file, 'w', encoding='utf-8') as f:
+                for sort_key in ('cumulative', 'tottime'):
+                    stream = io.StringIO()
+                    stats = pstats.Stats(profiler, stream=stream)
+                    stats.strip_dirs().sort_stats(sort_key).print_stats(self.top)
+                    f.write(f'===== Top {self.top} functions by {sort_key} time =====\n')
+                    f.write(stream.getvalue())
+                    f.write('\n')
+            
+            self.logger.info(f"CPU profile saved to: {self.cpu_report_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to write CPU profile: {str(e)}")
+    
+    def on_batch(self, batch_num):
+        """Snapshot memory at a batch boundary and report growth since the last one"""
+        if not self.memory or not tracemalloc.is_tracing():
+            return
+        
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            
+            with open(self.memory_report_file, 'a', encoding='utf-8') as f:
+                f.write(f'===== Batch {batch_num} at {datetime.now().isoformat()} - '
+                        f'current {current / 1024:.1f} KB, peak {peak / 1024:.1f} KB =====\n')
+                
+                if self.previous_snapshot is None:
+                    stats = snapshot.statistics('lineno')[:self.top]
+                    f.write('Top allocation sites:\n')
+                else:
+                    stats = snapshot.compare_to(self.previous_snapshot, 'lineno')[:self.top]
+                    f.write('Top growth since previous batch:\n')
+                    if stats:
+                        self.logger.info(f"Memory growth after batch {batch_num}: {stats[0]}")
+                
+                for stat in stats:
+                    f.write(f'{stat}\n')
+                f.write('\n')
+            
+            self.previous_snapshot = snapshot
+        except Exception as e:
+            self.logger.error(f"Failed to take memory snapshot: {str(e)}")
+    
+    def finish(self):
+        """Stop memory tracing and point at the report"""
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.logger.info(f"Memory report saved to: {self.memory_report_file}")
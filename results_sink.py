@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Results sinks for shortened URLs
+Thread-safe writers shared by every worker of a run, as CSV, compressed JSON lines or Parquet
+
+Every sink has write(record), flush() and close(). flush() makes every written record
+durable and readable; runners call it (through save_checkpoint) before marking links done.
+"""
+
+import os
+import io
+import sys
+import csv
+import glob
+import gzip
+import json
+import threading
+from datetime import datetime
+
+RESULT_FIELDS = ['timestamp', 'original_url', 'shortened_url', 'status']
+
+# Output format -> file extension; the sink class is picked from the extension
+RESULT_FORMATS = {
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'jsonl.gz': '.jsonl.gz',
+    'jsonl.zst': '.jsonl.zst',
+    'parquet': '.parquet'
+}
+
+class CsvResultsSink:
+    """Appends result rows to one CSV file, safe to share between threads"""
+    
+    def __init__(self, path, fieldnames=None):
+        self.path = path
+        self.fieldnames = list(fieldnames or RESULT_FIELDS)
+        self.lock = threading.Lock()
+        self.file = None
+        self.writer = None
+    
+    def _open(self):
+        file_exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self.file = open(self.path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction='ignore')
+        if not file_exists:
+            self.writer.writeheader()
+    
+    def write(self, record):
+        """Write one result record (a dict with at least the CSV fields)"""
+        with self.lock:
+            if self.file is None:
+                self._open()
+            self.writer.writerow(record)
+            # Flush every row so a crash never loses finished results
+            self.file.flush()
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.writer = None
+
+class JsonLinesResultsSink:
+    """Appends one JSON object per result, optionally gzip or zstd compressed (zstd needs zstandard)"""
+    
+    def __init__(self, path, fieldnames=None, compression=None, flush_every=100):
+        self.path = path
+        self.fieldnames = list(fieldnames or RESULT_FIELDS)
+        self.compression = compression
+        # Compressed streams are flushed every flush_every rows and by flush(); flushing each row would undo the compression
+        self.flush_every = 1 if compression is None else flush_every
+        self.lock = threading.Lock()
+        self.file = None
+        self.raw_file = None
+        self.unflushed = 0
+        
+        if compression == 'zstd':
+            import zstandard  # noqa: F401 - fail at startup rather than on the first result
+        elif compression not in (None, 'gzip'):
+            raise ValueError(f"Unknown compression: {compression}")
+    
+    def _open(self):
+        # Appending adds a new gzip member or zstd frame, which readers handle transparently
+        if self.compression == 'gzip':
+            self.file = gzip.open(self.path, 'ab')
+        elif self.compression == 'zstd':
+            import zstandard
+            self.raw_file = open(self.path, 'ab')
+            self.file = zstandard.ZstdCompressor(level=3).stream_writer(self.raw_file)
+        else:
+            self.file = open(self.path, 'ab')
+    
+    def write(self, record):
+        line = json.dumps({field: record.get(field) for field in self.fieldnames}, ensure_ascii=False)
+        with self.lock:
+            if self.file is None:
+                self._open()
+            self.file.write(line.encode('utf-8') + b'\n')
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self._flush()
+    
+    def _flush(self):
+        # End the zstd frame or gzip member: a sync flush inside one would leave a truncated stream after a crash
+        if self.compression == 'zstd':
+            import zstandard
+            self.file.flush(zstandard.FLUSH_FRAME)
+            self.raw_file.flush()
+        elif self.compression == 'gzip':
+            self.file.close()
+            self.file = None
+        else:
+            self.file.flush()
+        self.unflushed = 0
+    
+    def flush(self):
+        with self.lock:
+            if self.file is not None and self.unflushed:
+                self._flush()
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._flush()
+            if self.file is not None:
+                self.file.close()
+                if self.raw_file is not None and not self.raw_file.closed:
+                    self.raw_file.close()
+                self.file = None
+                self.raw_file = None
+
+class StdoutResultsSink:
+    """Writes each result as a JSON line to stdout as soon as it is produced, for shell pipelines"""
+    
+    def __init__(self, fieldnames=None, stream=None):
+        self.path = '-'
+        self.fieldnames = list(fieldnames or RESULT_FIELDS)
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+    
+    def write(self, record):
+        line = json.dumps({field: record.get(field) for field in self.fieldnames}, ensure_ascii=False)
+        with self.lock:
+            try:
+                self.stream.write(line + '\n')
+                self.stream.flush()
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`); the run continues and the checkpoint still records it
+                pass
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+def split_url(url):
+    """Split a URL into (prefix, name) at the last '/' before the query; prefix + name == url"""
+    path_end = url.find('?')
+    cut = url.rfind('/', 0, path_end if path_end >= 0 else len(url)) + 1
+    return url[:cut], url[cut:]
+
+class ParquetResultsSink:
+    """Columnar results with dictionary-encoded host and path prefix columns (needs pyarrow)
+    
+    original_url is stored as host + path_prefix + name, so the repeated parts of links
+    from one series are kept once per row group. A Parquet file is only readable once its
+    footer is written, so rows go to a new file next to it and are also spooled as JSON
+    lines; close() moves the new file into place and drops the spool. A later run with the
+    same path (e.g. --resume) copies the existing row groups and any rows spooled by a run
+    that was killed, so results are appended rather than replaced. Spools left behind
+    under other names are picked up by recover_parquet_spools. The spool is locked while
+    the sink is open, so a live run's spool is never taken over.
+    """
+    
+    def __init__(self, path, fieldnames=None, row_group_size=10000):
+        import pyarrow as pa
+        
+        self.path = path
+        self.fieldnames = list(fieldnames or RESULT_FIELDS)
+        self.row_group_size = row_group_size
+        self.lock = threading.Lock()
+        self.writer = None
+        self.spool = None
+        self.rows = []
+        self.temp_path = path + '.tmp'
+        self.spool_path = path + '.pending'
+        
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        columns = [
+            ('timestamp', pa.timestamp('us')),
+            ('host', dictionary),
+            ('path_prefix', dictionary),
+            ('name', pa.string()),
+            ('shortened_url', pa.string()),
+            ('status', dictionary)
+        ]
+        columns += [(field, dictionary) for field in self.fieldnames if field not in RESULT_FIELDS]
+        self.schema = pa.schema(columns)
+    
+    def _open_spool(self):
+        """Open and lock the spool; raises OSError if another sink holds it"""
+        while True:
+            spool = open(self.spool_path, 'a+b')
+            if not lock_file(spool):
+                spool.close()
+                raise OSError(f"{self.spool_path} is in use by another run")
+            # The previous owner may have finished and removed it while we waited for the lock
+            if os.name == 'nt' or os.fstat(spool.fileno()).st_nlink > 0:
+                return spool
+            spool.close()
+    
+    def _open(self):
+        import pyarrow.parquet as pq
+        
+        spool = self._open_spool()
+        spool.seek(0)
+        data = spool.read()
+        # A killed run can leave half a line at the end; cut it so appended lines start cleanly
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            spool.truncate(end)
+        
+        self.writer = pq.ParquetWriter(self.temp_path, self.schema, compression='zstd', use_dictionary=True)
+        if os.path.exists(self.path):
+            existing = pq.ParquetFile(self.path)
+            for index in range(existing.num_row_groups):
+                self.writer.write_table(existing.read_row_group(index).cast(self.schema))
+        self.rows = [json.loads(line) for line in data[:end].decode('utf-8').splitlines() if line]
+        self._write_row_group()
+        self.spool = spool
+    
+    def write(self, record):
+        line = json.dumps({field: record.get(field) for field in self.fieldnames}, ensure_ascii=False)
+        with self.lock:
+            if self.writer is None:
+                self._open()
+            self.spool.write(line.encode('utf-8') + b'\n')
+            self.rows.append(record)
+            if len(self.rows) >= self.row_group_size:
+                self._write_row_group()
+    
+    def flush(self):
+        with self.lock:
+            if self.spool is not None:
+                self.spool.flush()
+    
+    def _write_row_group(self):
+        import pyarrow as pa
+        
+        columns = {name: [] for name in self.schema.names}
+        for record in self.rows:
+            prefix, name = split_url(record.get('original_url') or '')
+            host_end = prefix.find('/', prefix.find('//') + 2) if '//' in prefix else 0
+            host_end = len(prefix) if host_end < 0 else host_end
+            timestamp = record.get('timestamp')
+            columns['timestamp'].append(datetime.fromisoformat(timestamp) if timestamp else None)
+            columns['host'].append(prefix[:host_end])
+            columns['path_prefix'].append(prefix[host_end:])
+            columns['name'].append(name)
+            for field in self.schema.names[4:]:
+                value = record.get(field)
+                columns[field].append(None if value is None else str(value))
+        
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+        self.rows = []
+    
+    def close(self):
+        with self.lock:
+            if self.writer is None:
+                return
+            self._write_row_group()
+            self.writer.close()
+            self.writer = None
+            os.replace(self.temp_path, self.path)
+            # Removed while still locked, so nobody can take over a spool that is already folded in;
+            # Windows can't remove an open file
+            if os.name != 'nt':
+                os.remove(self.spool_path)
+            self.spool.close()
+            self.spool = None
+            if os.name == 'nt':
+                os.remove(self.spool_path)
+    
+    def recover(self):
+        """Fold a spool left by a killed run into the file; returns False if its run is still going"""
+        with self.lock:
+            try:
+                self._open()
+            except OSError:
+                return False
+        self.close()
+        return True
+
+def lock_file(f):
+    """Take a non-blocking exclusive lock on an open file; returns False if it is already held"""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            # msvcrt locks byte ranges; everyone locks the first byte
+            position = f.tell()
+            f.seek(0)
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            finally:
+                f.seek(position)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def recover_parquet_spools(directory, logger=None):
+    """Fold rows spooled by killed Parquet runs in directory into their files; returns the recovered paths
+    
+    Results files are timestamped per run, so a resumed run writes a new file and would
+    otherwise leave the killed run's last results only in its spool.
+    """
+    recovered = []
+    for spool_path in sorted(glob.glob(os.path.join(directory, '*.parquet.pending'))):
+        path = spool_path[:-len('.pending')]
+        fieldnames = None
+        try:
+            with open(spool_path, 'r', encoding='utf-8') as f:
+                first = f.readline()
+            if first.endswith('\n'):
+                fieldnames = list(json.loads(first))
+            if ParquetResultsSink(path, fieldnames).recover():
+                recovered.append(path)
+                if logger:
+                    logger.info(f"Recovered results spooled by an interrupted run into {path}")
+        except (OSError, ValueError) as e:
+            if logger:
+                logger.warning(f"Could not recover {spool_path}: {str(e)}")
+    return recovered
+
+def results_path(output_dir, output_format='csv', stem='shortened_urls'):
+    """Timestamped results file name for a run"""
+    return os.path.join(output_dir, f'{stem}_{datetime.now().strftime("%Y%m%d_%H%M%S")}{RESULT_FORMATS[output_format]}')
+
+def results_stem(path):
+    """Results file path without its format extension, for naming companion files"""
+    for extension in sorted(RESULT_FORMATS.values(), key=len, reverse=True):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return os.path.splitext(path)[0]
+
+def create_results_sink(path, fieldnames=None):
+    """Sink for a results file, chosen by its extension; '-' writes JSON lines to stdout"""
+    if path == '-':
+        return StdoutResultsSink(fieldnames)
+    if path.endswith('.jsonl.gz'):
+        return JsonLinesResultsSink(path, fieldnames, compression='gzip')
+    if path.endswith('.jsonl.zst'):
+        return JsonLinesResultsSink(path, fieldnames, compression='zstd')
+    if path.endswith('.jsonl'):
+        return JsonLinesResultsSink(path, fieldnames)
+    if path.endswith('.parquet'):
+        recover_parquet_spools(os.path.dirname(path) or '.')
+        return ParquetResultsSink(path, fieldnames)
+    return CsvResultsSink(path, fieldnames)
+
+def iter_results(path):
+    """Read result records back from a file in any of the output formats"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        
+        for batch in pq.ParquetFile(path).iter_batches():
+            for row in batch.to_pylist():
+                host, path_prefix, name = row.pop('host'), row.pop('path_prefix'), row.pop('name')
+                row['original_url'] = f'{host or ""}{path_prefix or ""}{name or ""}'
+                if row['timestamp'] is not None:
+                    row['timestamp'] = row['timestamp'].isoformat()
+                yield row
+        return
+    
+    if path.endswith('.jsonl.zst'):
+        import zstandard
+        
+        with open(path, 'rb') as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            for line in io.TextIOWrapper(reader, encoding='utf-8'):
+                if line.strip():
+                    yield json.loads(line)
+        return
+    
+    if path.endswith('.jsonl') or path.endswith('.jsonl.gz'):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
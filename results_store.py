@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consolidated results store for URL shortener
+Merges the per-run result CSVs into one indexed SQLite file holding the newest short link per URL
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import logging
+import sqlite3
+import argparse
+import threading
+
+from config import Config
+from utils import canonicalize_url, URL_NORMALIZATIONS, DEFAULT_URL_NORMALIZATIONS
+from results_sink import RESULT_FORMATS, iter_results, recover_parquet_spools
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    url_key TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    shortened_url TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    account TEXT,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    inode INTEGER,
+    offset INTEGER NOT NULL,
+    header TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Newer successes replace older ones; ISO timestamps compare correctly as text
+UPSERT = """
+INSERT INTO results (url_key, original_url, shortened_url, timestamp, account, source)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (url_key) DO UPDATE SET
+    original_url = excluded.original_url,
+    shortened_url = excluded.shortened_url,
+    timestamp = excluded.timestamp,
+    account = excluded.account,
+    source = excluded.source
+WHERE excluded.timestamp >= results.timestamp
+"""
+
+# SQLite's default limit on parameters in one statement is 999
+LOOKUP_CHUNK = 500
+
+DEFAULT_RESULTS_DB = os.path.join('output', 'results.db')
+RESULTS_PATTERN = 'shortened_urls_*'
+
+def normalizations_name(normalizations):
+    """Text form of a normalization policy, as --normalize takes it"""
+    return ','.join(normalizations) or 'none'
+
+class ResultsStore:
+    """Newest successful short link per canonical URL, filled incrementally from result CSVs
+    
+    URLs are keyed with url_normalizations, which is recorded in the store; opening it
+    with a different policy raises ValueError, since the existing keys would not match.
+    """
+    
+    def __init__(self, path=DEFAULT_RESULTS_DB, busy_timeout=30, url_normalizations=DEFAULT_URL_NORMALIZATIONS):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.url_normalizations = tuple(url_normalizations)
+        self.local = threading.local()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        # WAL lets lookups run while a consolidation is writing
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        self._check_normalizations()
+    
+    def _check_normalizations(self):
+        conn = self._connection()
+        wanted = normalizations_name(self.url_normalizations)
+        with conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'url_normalizations'").fetchone()
+            if row is None:
+                # Stores filled before the policy was recorded were keyed with the default one
+                filled = conn.execute("SELECT 1 FROM results LIMIT 1").fetchone() is not None
+                recorded = normalizations_name(DEFAULT_URL_NORMALIZATIONS) if filled else wanted
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('url_normalizations', ?)", (recorded,))
+                row = conn.execute("SELECT value FROM meta WHERE key = 'url_normalizations'").fetchone()
+        
+        if row[0] != wanted:
+            raise ValueError(
+                f"{self.path} keys URLs with normalizations '{row[0]}', not '{wanted}'; "
+                f"use --normalize {row[0]} or a separate results database"
+            )
+    
+    def link_key(self, url):
+        return canonicalize_url(url, self.url_normalizations)
+    
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            self.local.conn = conn
+        return conn
+    
+    def _rows(self, records, source):
+        for record in records:
+            if str(record.get('status', '')).upper() != 'SUCCESS':
+                continue
+            # Rows from verify_links output whose short link turned out wrong
+            if record.get('verified') in ('no', 'broken'):
+                continue
+            original_url = (record.get('original_url') or '').strip()
+            shortened_url = (record.get('shortened_url') or '').strip()
+            if not original_url or not shortened_url or shortened_url == 'FAILED':
+                continue
+            yield (self.link_key(original_url), original_url, shortened_url,
+                   record.get('timestamp') or '', record.get('account'), source)
+    
+    def add_records(self, records, source=None):
+        """Merge result records (dicts in the results sink format); returns how many were successes"""
+        rows = list(self._rows(records, source))
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPSERT, rows)
+        return len(rows)
+    
+    def import_file(self, path):
+        """Merge rows added to a results file since the last import; returns the number of successes"""
+        path = os.path.abspath(path)
+        conn = self._connection()
+        stat = os.stat(path)
+        known = conn.execute("SELECT inode, offset, header FROM imported_files WHERE path = ?", (path,)).fetchone()
+        
+        # A replaced or truncated file is read again from the start
+        if known and known[0] == stat.st_ino and known[1] <= stat.st_size:
+            offset, header = known[1], json.loads(known[2])
+        else:
+            offset, header = 0, None
+        if offset == stat.st_size:
+            return 0
+        
+        if not path.endswith('.csv'):
+            # Compressed and columnar files can't be resumed mid-way; upserts make a full re-read harmless
+            rows = list(self._rows(iter_results(path), os.path.basename(path)))
+            with conn:
+                conn.executemany(UPSERT, rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO imported_files (path, inode, offset, header) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_ino, stat.st_size, '[]')
+                )
+            return len(rows)
+        
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # Leave a row that is still being written for the next import
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        lines = data[:end].decode('utf-8').splitlines()
+        
+        if header is None:
+            header = next(csv.reader(lines[:1]), [])
+            lines = lines[1:]
+        records = csv.DictReader(lines, fieldnames=header)
+        
+        rows = list(self._rows(records, os.path.basename(path)))
+        with conn:
+            conn.executemany(UPSERT, rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO imported_files (path, inode, offset, header) VALUES (?, ?, ?, ?)",
+                (path, stat.st_ino, offset + end, json.dumps(header))
+            )
+        return len(rows)
+    
+    def consolidate(self, paths=None, output_dir='output', logger=None):
+        """Import new rows from the given files, or every results file in output_dir; returns the count"""
+        if paths is None:
+            try:
+                recover_parquet_spools(output_dir, logger)
+            except ImportError:
+                if logger:
+                    logger.warning("pyarrow is not installed; Parquet results spooled by interrupted runs were not recovered")
+            paths = sorted(
+                path for extension in RESULT_FORMATS.values()
+                for path in glob.glob(os.path.join(output_dir, RESULTS_PATTERN + extension))
+            )
+        
+        total = 0
+        for path in paths:
+            try:
+                added = self.import_file(path)
+            except Exception as e:
+                if logger:
+                    logger.warning(f"Could not import {path}: {str(e)}")
+                continue
+            if added and logger:
+                logger.info(f"Imported {added} results from {path}")
+            total += added
+        return total
+    
+    def lookup(self, url):
+        """Newest successful result for a URL, or None"""
+        return self.lookup_many([url]).get(url)
+    
+    def lookup_many(self, urls):
+        """{url: result} for every URL that has a successful result"""
+        keys = {}
+        for url in urls:
+            keys.setdefault(self.link_key(url), []).append(url)
+        
+        found = {}
+        conn = self._connection()
+        key_list = list(keys)
+        for i in range(0, len(key_list), LOOKUP_CHUNK):
+            chunk = key_list[i:i + LOOKUP_CHUNK]
+            cursor = conn.execute(
+                "SELECT url_key, original_url, shortened_url, timestamp, account, source FROM results "
+                f"WHERE url_key IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for url_key, original_url, shortened_url, timestamp, account, source in cursor:
+                result = {
+                    'original_url': original_url,
+                    'shortened_url': shortened_url,
+                    'timestamp': timestamp,
+                    'account': account,
+                    'source': source
+                }
+                for url in keys[url_key]:
+                    found[url] = result
+        return found
+    
+    def stats(self):
+        conn = self._connection()
+        return {
+            'urls': conn.execute("SELECT COUNT(*) FROM results").fetchone()[0],
+            'files': conn.execute("SELECT COUNT(*) FROM imported_files").fetchone()[0]
+        }
+    
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+def read_url_list(path):
+    """URLs from a links file (or '-' for stdin), skipping blanks and comments"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def main():
+    """Consolidate result CSVs or look up short links"""
+    parser = argparse.ArgumentParser(description='Consolidated store of shortened URLs')
+    parser.add_argument('--db', default=DEFAULT_RESULTS_DB, help='Path to the results SQLite file')
+    parser.add_argument('--output-dir', default='output', help='Directory holding shortened_urls_* results files')
+    parser.add_argument('--normalize', help='Comma-separated URL normalizations used to match URLs (host,port,percent_encoding,trailing_slash,fragment) or none; default from config.json')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    consolidate_parser = subparsers.add_parser('consolidate', help='Merge new result rows into the store')
+    consolidate_parser.add_argument('files', nargs='*', help='Results files (default: every one in --output-dir)')
+    
+    lookup_parser = subparsers.add_parser('lookup', help='Find the short links for URLs')
+    lookup_parser.add_argument('urls', nargs='*', help='URLs to look up')
+    lookup_parser.add_argument('--file', help="Links file to look up ('-' for stdin)")
+    lookup_parser.add_argument('--json', action='store_true', help='Print one JSON object per URL')
+    lookup_parser.add_argument('--refresh', action='store_true', help='Consolidate new result rows first')
+    
+    subparsers.add_parser('stats', help='Show how many URLs and files the store holds')
+    
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger('results_store')
+    
+    # Same policy as the shortener runs, so lookups match the way duplicates were spotted
+    url_normalizations = Config(url_normalizations=args.normalize).url_normalizations
+    unknown = [name for name in url_normalizations if name not in URL_NORMALIZATIONS]
+    if unknown:
+        parser.error(f"unknown URL normalizations: {', '.join(unknown)} (choose from {', '.join(URL_NORMALIZATIONS)})")
+    
+    try:
+        store = ResultsStore(args.db, url_normalizations=url_normalizations)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    
+    try:
+        if args.command == 'consolidate':
+            added = store.consolidate(args.files or None, args.output_dir, logger)
+            counts = store.stats()
+            print(f"Imported {added} results; the store holds {counts['urls']} URLs from {counts['files']} files")
+            return 0
+        
+        if args.command == 'stats':
+            counts = store.stats()
+            print(f"urls: {counts['urls']}, files: {counts['files']}")
+            return 0
+        
+        urls = list(args.urls)
+        if args.file:
+            urls.extend(read_url_list(args.file))
+        if not urls:
+            parser.error('lookup needs URLs or --file')
+        
+        if args.refresh:
+            store.consolidate(output_dir=args.output_dir, logger=logger)
+        found = store.lookup_many(urls)
+        
+        for url in urls:
+            result = found.get(url)
+            if args.json:
+                print(json.dumps({'url': url, **(result or {'shortened_url': None})}, ensure_ascii=False))
+            else:
+                print(f"{url}\t{result['shortened_url'] if result else '-'}")
+        return 0 if len(found) == len(set(urls)) else 1
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
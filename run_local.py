@@ -14,6 +14,7 @@ from datetime import datetime
 from url_shortener import URLShortener
 from config import Config
 from utils import setup_logging, validate_files
+from results_sink import RESULT_FORMATS
 
 def check_chrome_compatibility():
     """Check and fix Chrome/ChromeDriver compatibility"""
@@ -64,8 +65,22 @@ def main():
     parser.add_argument('--output-dir', default='output', help='Output directory')
     parser.add_argument('--batch-size', type=int, default=5, help='Batch size (recommended: 5)')
     parser.add_argument('--delay', type=float, default=3.0, help='Delay between requests (recommended: 3.0)')
+    parser.add_argument('--max-links', type=int, default=1000, help='Shorten at most this many links from the input files (0 for no limit)')
     parser.add_argument('--headless', action='store_true', help='Run in headless mode')
     parser.add_argument('--resume', action='store_true', help='Resume from checkpoint')
+    parser.add_argument('--metrics-file', help='Write Prometheus metrics to this file (textfile exporter)')
+    parser.add_argument('--trace', help='Write a per-link trace (Chrome trace-event JSON) to this file')
+    parser.add_argument('--profile', action='store_true', help='Profile CPU usage with cProfile')
+    parser.add_argument('--profile-memory', action='store_true', help='Report memory growth between batches with tracemalloc')
+    parser.add_argument('--recycle-rss-mb', type=int, default=1500, help='Restart Chrome between batches above this memory use in MB (0 disables)')
+    parser.add_argument('--recycle-after', type=int, default=500, help='Restart Chrome between batches after this many links (0 disables)')
+    parser.add_argument('--max-recoveries', type=int, default=20, help='Give up after this many driver crashes or expired sessions')
+    parser.add_argument('--breaker-threshold', type=int, default=5, help='Pause after this many consecutive failed links')
+    parser.add_argument('--preflight', choices=['skip', 'flag'], help='Probe links first; skip dead ones or record them as DEAD')
+    parser.add_argument('--preflight-concurrency', type=int, default=32, help='Concurrent pre-flight probes')
+    parser.add_argument('--preflight-per-host', type=int, default=4, help='Concurrent pre-flight probes per host')
+    parser.add_argument('--normalize', help='Comma-separated URL normalizations used to spot duplicate links (host,port,percent_encoding,trailing_slash,fragment) or none')
+    parser.add_argument('--output-format', default='csv', choices=list(RESULT_FORMATS), help='Results file format (jsonl.zst needs zstandard, parquet needs pyarrow)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose logging')
     
     args = parser.parse_args()
@@ -95,7 +110,21 @@ def main():
             batch_size=args.batch_size,
             delay=args.delay,
             headless=args.headless,
-            resume=args.resume
+            resume=args.resume,
+            metrics_file=args.metrics_file,
+            trace_file=args.trace,
+            profile=args.profile,
+            profile_memory=args.profile_memory,
+            recycle_rss_mb=args.recycle_rss_mb,
+            recycle_after_links=args.recycle_after,
+            max_recoveries=args.max_recoveries,
+            breaker_threshold=args.breaker_threshold,
+            preflight=args.preflight,
+            preflight_concurrency=args.preflight_concurrency,
+            preflight_per_host=args.preflight_per_host,
+            url_normalizations=args.normalize,
+            output_format=args.output_format,
+            max_links=args.max_links
         )
         
         print("🔄 در حال راه‌اندازی WebDriver...")
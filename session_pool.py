@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool of warm, logged-in URLShortener sessions
+Lets short requests reuse a running Chrome instead of launching and logging in every time
+"""
+
+import hashlib
+import tempfile
+import threading
+import time
+from collections import deque
+
+from url_shortener import URLShortener
+from config import Config
+
+class PooledSession:
+    """One logged-in URLShortener owned by the pool"""
+    
+    def __init__(self, key, shortener):
+        self.key = key
+        self.shortener = shortener
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.links_served = 0
+
+class LatencyTracker:
+    """Keeps recent request latencies and reports percentiles"""
+    
+    def __init__(self, max_samples=1000):
+        self.samples = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+    
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+    
+    def percentile(self, percent):
+        with self.lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def summary(self):
+        return {
+            'samples': len(self.samples),
+            'p50_ms': self._to_ms(self.percentile(50)),
+            'p95_ms': self._to_ms(self.percentile(95)),
+            'p99_ms': self._to_ms(self.percentile(99))
+        }
+    
+    @staticmethod
+    def _to_ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+class SessionPool:
+    """Pre-started sessions keyed by account, with idle eviction and health checks"""
+    
+    def __init__(self, logger, max_sessions_per_account=2, idle_timeout=900,
+                 maintenance_interval=60, acquire_timeout=120):
+        self.logger = logger
+        self.max_sessions_per_account = max_sessions_per_account
+        self.idle_timeout = idle_timeout
+        self.maintenance_interval = maintenance_interval
+        self.acquire_timeout = acquire_timeout
+        
+        self.idle = {}       # key -> list of PooledSession ready for use
+        self.counts = {}     # key -> sessions alive or starting for the account
+        self.condition = threading.Condition()
+        self.maintenance_thread = None
+        self.stopped = False
+    
+    @staticmethod
+    def account_key(username, password):
+        """Pool key; includes the password so a wrong one never reuses a session"""
+        digest = hashlib.sha256(f'{username}\0{password}'.encode('utf-8')).hexdigest()
+        return f'{username}:{digest[:16]}'
+    
+    def _start_session(self, key, username, password):
+        """Launch Chrome and log in for a new pooled session"""
+        config = Config(
+            username=username,
+            password=password,
+            output_dir=tempfile.gettempdir(),
+            headless=True
+        )
+        shortener = URLShortener(config, self.logger)
+        
+        if not shortener.setup_driver() or not shortener.login():
+            shortener.cleanup()
+            return None
+        
+        self.logger.info(f"Started pooled session for {username}")
+        return PooledSession(key, shortener)
+    
+    def acquire(self, username, password):
+        """Get a logged-in session for the account, starting one if needed"""
+        key = self.account_key(username, password)
+        deadline = time.time() + self.acquire_timeout
+        
+        with self.condition:
+            while True:
+                idle_sessions = self.idle.get(key)
+                if idle_sessions:
+                    session = idle_sessions.pop()
+                    break
+                
+                if self.counts.get(key, 0) < self.max_sessions_per_account:
+                    # Reserve the slot now and log in outside the lock
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                    session = None
+                    break
+                
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+        
+        if session is not None:
+            if self.is_healthy(session):
+                return session
+            self._discard(session)
+            return self.acquire(username, password)
+        
+        session = self._start_session(key, username, password)
+        if session is None:
+            with self.condition:
+                self.counts[key] -= 1
+                self.condition.notify_all()
+        return session
+    
+    def release(self, session, healthy=True):
+        """Return a session to the pool, or close it if it is broken"""
+        if not healthy or self.stopped:
+            self._discard(session)
+            return
+        
+        session.last_used = time.time()
+        with self.condition:
+            self.idle.setdefault(session.key, []).append(session)
+            self.condition.notify_all()
+    
+    def _discard(self, session):
+        """Close a session and free its slot"""
+        session.shortener.cleanup()
+        with self.condition:
+            self.counts[session.key] = max(self.counts.get(session.key, 1) - 1, 0)
+            self.condition.notify_all()
+    
+    def is_healthy(self, session):
+        """Check that the driver still responds and is still on the dashboard"""
+        try:
+            current_url = session.shortener.driver.current_url
+            return session.shortener.selectors['dashboard_url'] in current_url
+        except Exception as e:
+            self.logger.warning(f"Pooled session failed health check: {str(e)}")
+            return False
+    
+    def prewarm(self, username, password, count=1):
+        """Start sessions ahead of the first request"""
+        sessions = []
+        for _ in range(count):
+            session = self.acquire(username, password)
+            if session is None:
+                break
+            sessions.append(session)
+        for session in sessions:
+            self.release(session)
+        return len(sessions)
+    
+    def evict_idle(self):
+        """Close idle sessions past the timeout and health-check the rest"""
+        now = time.time()
+        expired = []
+        
+        with self.condition:
+            for key, idle_sessions in self.idle.items():
+                keep = []
+                for session in idle_sessions:
+                    if now - session.last_used > self.idle_timeout:
+                        expired.append(session)
+                    else:
+                        keep.append(session)
+                self.idle[key] = keep
+            candidates = [s for sessions in self.idle.values() for s in sessions]
+        
+        for session in expired:
+            self.logger.info("Evicting idle pooled session")
+            self._discard(session)
+        
+        # Health-check sessions that are still idle; a busy one is checked on acquire
+        for session in candidates:
+            with self.condition:
+                idle_sessions = self.idle.get(session.key, [])
+                if session not in idle_sessions:
+                    continue
+                idle_sessions.remove(session)
+            self.release(session, healthy=self.is_healthy(session))
+    
+    def _maintenance_loop(self):
+        while not self.stopped:
+            time.sleep(self.maintenance_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                self.logger.error(f"Session pool maintenance failed: {str(e)}")
+    
+    def start_maintenance(self):
+        """Start the background eviction and health-check thread"""
+        if self.maintenance_thread is None:
+            self.maintenance_thread = threading.Thread(target=self._maintenance_loop)
+            self.maintenance_thread.daemon = True
+            self.maintenance_thread.start()
+    
+    def stats(self):
+        """Session counts per account"""
+        with self.condition:
+            return {
+                key.split(':')[0]: {
+                    'sessions': count,
+                    'idle': len(self.idle.get(key, []))
+                }
+                for key, count in self.counts.items() if count
+            }
+    
+    def shutdown(self):
+        """Close every idle session"""
+        self.stopped = True
+        with self.condition:
+            sessions = [s for idle_sessions in self.idle.values() for s in idle_sessions]
+            self.idle = {}
+        for session in sessions:
+            self._discard(session)
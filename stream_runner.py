@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming mode for URL shortener
+Shortens links as they are read from files or stdin, so the shortener fits into shell pipelines
+"""
+
+import sys
+
+from url_shortener import URLShortener, SessionLostError
+from metrics import QUEUE_DEPTH
+from link_store import LinkSet
+
+def iter_input_links(paths):
+    """Yield links from files in order; '-' reads stdin line by line as lines arrive"""
+    for path in paths:
+        f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+        try:
+            # readline rather than iteration, so a link is handed on as soon as its line is complete
+            for line in iter(f.readline, ''):
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+class StreamRunner:
+    """Single session that pulls links lazily instead of reading every input up front"""
+    
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.shortener = URLShortener(config, logger)
+        self.results_file = self.shortener.results_file
+        self.successful = 0
+        self.failed = 0
+    
+    def _fresh_links(self, processed_links):
+        seen = LinkSet()
+        for link in iter_input_links(self.config.input_files):
+            key = self.shortener.link_key(link)
+            if key in processed_links or key in seen:
+                continue
+            seen.add(key)
+            yield link
+    
+    def run(self):
+        """Shorten links until the inputs end; returns True if any link succeeded"""
+        shortener = self.shortener
+        processed_links = None
+        
+        try:
+            if not shortener.setup_driver() or not shortener.login():
+                return False
+            
+            if self.config.preflight:
+                self.logger.warning("Pre-flight checks need the whole input up front; not applied to streamed links")
+            
+            processed_links = shortener.load_checkpoint()
+            self.logger.info(f"Streaming links from {', '.join(self.config.input_files)}")
+            
+            done = 0
+            for record in shortener.shorten_many(self._fresh_links(processed_links)):
+                if record['status'] == 'success':
+                    self.successful += 1
+                else:
+                    self.failed += 1
+                processed_links.add(shortener.link_key(record['original_url']))
+                
+                done += 1
+                if done % self.config.batch_size == 0:
+                    shortener.save_checkpoint(processed_links)
+                    shortener.write_metrics()
+                    self.logger.info(f"Progress: {done} processed - Success: {self.successful}, Failed: {self.failed}")
+            
+            self.logger.info(f"Input ended: {self.successful} successful, {self.failed} failed")
+            return self.successful > 0
+        
+        except SessionLostError as e:
+            self.logger.error(f"Session could not be recovered, stopping: {str(e)}")
+            return self.successful > 0
+        
+        finally:
+            # Not reached the checkpoint yet (e.g. login failed): leave an existing one untouched
+            if processed_links is not None:
+                shortener.save_checkpoint(processed_links)
+            QUEUE_DEPTH.set(0)
+            shortener.cleanup()
+            shortener.write_metrics()
+            shortener.close_outputs()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-link tracing in Chrome trace-event format
+Output opens in Perfetto (ui.perfetto.dev) or about://tracing
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+class Tracer:
+    """Buffers trace events in memory and appends them to a JSON file in batches"""
+    
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.thread_ids = {}
+        self.lock = threading.Lock()
+        self.written = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[\n')
+        
+        self._add({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                   'args': {'name': 'url_shortener'}})
+    
+    def _now_us(self):
+        return (time.perf_counter() - self.origin) * 1_000_000
+    
+    def _thread_id(self):
+        """Small stable id per worker thread, announced with a thread_name event"""
+        ident = threading.get_ident()
+        tid = self.thread_ids.get(ident)
+        if tid is None:
+            with self.lock:
+                tid = self.thread_ids.setdefault(ident, len(self.thread_ids) + 1)
+            self.name_thread(threading.current_thread().name)
+        return tid
+    
+    def name_thread(self, name):
+        """Label the current thread's track, e.g. with a worker or account name"""
+        self._add({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                   'tid': self._thread_id(), 'args': {'name': name}})
+    
+    def _add(self, event):
+        with self.lock:
+            self.events.append(event)
+            if len(self.events) >= self.flush_every:
+                self._flush_locked()
+    
+    @contextmanager
+    def span(self, name, category='link', **args):
+        """Record a complete ('X') event covering the block"""
+        tid = self._thread_id()
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            self._add({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round(start, 1),
+                'dur': round(self._now_us() - start, 1),
+                'pid': self.pid,
+                'tid': tid,
+                'args': {key: value for key, value in args.items() if value is not None}
+            })
+    
+    def instant(self, name, category='link', **args):
+        """Record a point-in-time event"""
+        self._add({'name': name, 'cat': category, 'ph': 'i', 's': 't',
+                   'ts': round(self._now_us(), 1), 'pid': self.pid,
+                   'tid': self._thread_id(), 'args': args})
+    
+    def _flush_locked(self):
+        if not self.events or self.file is None:
+            return
+        chunks = []
+        for event in self.events:
+            prefix = ',\n' if self.written else ''
+            chunks.append(prefix + json.dumps(event, ensure_ascii=False))
+            self.written += 1
+        self.file.write(''.join(chunks))
+        self.file.flush()
+        self.events = []
+    
+    def flush(self):
+        """Write buffered events to disk"""
+        with self.lock:
+            self._flush_locked()
+    
+    def close(self):
+        """Flush remaining events and terminate the JSON array"""
+        with self.lock:
+            if self.file is None:
+                return
+            self._flush_locked()
+            self.file.write('\n]\n')
+            self.file.close()
+            self.file = None
+
+class NullTracer:
+    """Tracer that records nothing, used when tracing is off"""
+    
+    @contextmanager
+    def span(self, name, category='link', **args):
+        yield
+    
+    def instant(self, name, category='link', **args):
+        pass
+    
+    def name_thread(self, name):
+        pass
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+NULL_TRACER = NullTracer()
+
+def create_tracer(path):
+    """Tracer for the given output path, or a no-op tracer when path is empty"""
+    return Tracer(path) if path else NULL_TRACER
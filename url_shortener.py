@@ -6,9 +6,12 @@ Handles web automation using Selenium WebDriver
 """
 
 import os
+import sys
 import json
 import time
-import csv
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -16,20 +19,84 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from selenium.common.exceptions import (TimeoutException, NoSuchElementException, WebDriverException,
+                                        InvalidSessionIdException)
 from webdriver_manager.chrome import ChromeDriverManager
+from metrics import (REGISTRY, LINKS_SHORTENED, LINKS_FAILED, SETUP_DRIVER_SECONDS, LOGIN_SECONDS,
+                     SHORTEN_STEP_SECONDS, SAVE_RESULT_SECONDS, QUEUE_DEPTH, ACTIVE_DRIVERS,
+                     CHROME_RSS_BYTES, DRIVER_RECYCLES, SESSION_RECOVERIES, LINKS_RETRIED, timed)
+from utils import get_process_tree_rss, canonicalize_url
+from driver_instrumentation import CommandStats, instrument_driver
+from tracing import create_tracer
+from profiling import RunProfiler
+from circuit_breaker import CircuitBreaker
+from results_sink import create_results_sink, results_path, results_stem
+from link_store import FrontCodedList, LinkSet
+
+# Error message fragments meaning ChromeDriver or Chrome is gone
+DEAD_DRIVER_MARKERS = (
+    'invalid session id',
+    'chrome not reachable',
+    'session deleted',
+    'disconnected',
+    'no such window',
+    'target window already closed',
+    'connection refused',
+    'max retries exceeded'
+)
+
+class SessionLostError(Exception):
+    """The driver died or 2ad.ir logged us out while a link was in flight"""
+    pass
+
+# ChromeDriver process ids of running drivers, used for the Chrome RSS gauge
+active_driver_pids = set()
+CHROME_RSS_BYTES.set_function(lambda: sum(get_process_tree_rss(pid) for pid in list(active_driver_pids)))
 
 class URLShortener:
     """Main class for URL shortening automation on 2ad.ir"""
     
-    def __init__(self, config, logger):
+    def __init__(self, config, logger, circuit_breaker=None, results_sink=None, tracer=None):
         self.config = config
         self.logger = logger
+        self.account_name = config.username
+        # Workers running side by side share one breaker so an outage pauses all of them
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            logger,
+            failure_threshold=config.breaker_threshold,
+            timeout_threshold=config.breaker_timeout_threshold,
+            max_backoff=config.breaker_max_backoff
+        )
+        self.last_failure_timeout = False
+        # Visit each new short link in a browser tab; the async pipeline does it over HTTP instead
+        self.register_in_browser = True
         self.driver = None
+        self.driver_pid = None
+        self.links_since_restart = 0
+        self.recoveries = 0
         self.wait = None
-        self.processed_links = set()
+        self.command_stats = CommandStats()
+        self.owns_tracer = tracer is None
+        self.tracer = tracer or create_tracer(config.trace_file)
+        self.current_attempt = 1
+        # Earliest time the next link may start, so the delay holds across shorten_many calls
+        self.next_link_at = 0
+        self.processed_links = LinkSet()
+        # Read positions of watched input files, saved with the checkpoint
+        self.file_offsets = {}
         self.checkpoint_file = os.path.join(config.output_dir, 'checkpoint.json')
-        self.results_file = os.path.join(config.output_dir, f'shortened_urls_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
+        self.owns_results_sink = results_sink is None
+        self.results_sink = results_sink or create_results_sink(
+            config.output_path or results_path(config.output_dir, config.output_format)
+        )
+        self.results_file = self.results_sink.path
+        # Profiles and reports sit next to the results, or in output_dir when results go to stdout
+        self.output_stem = (results_stem(self.results_file) if self.results_file != '-' else
+                            results_stem(results_path(config.output_dir, 'csv', stem='stdout')))
+        self.profiler = RunProfiler(
+            self.output_stem, logger,
+            cpu=config.profile, memory=config.profile_memory
+        )
         
         # Selectors for 2ad.ir website (based on user specification)
         self.selectors = {
@@ -43,6 +110,7 @@ class URLShortener:
             'dashboard_url': 'https://2ad.ir/member/dashboard'
         }
     
+    @timed(SETUP_DRIVER_SECONDS)
     def setup_driver(self):
         """Setup Chrome WebDriver with appropriate options"""
         try:
@@ -130,10 +198,18 @@ class URLShortener:
             if not driver_initialized:
                 raise WebDriverException("Failed to initialize ChromeDriver with any method")
             
+            # Count and time every chromedriver round trip
+            instrument_driver(self.driver, self.command_stats)
+            
             self.driver.set_page_load_timeout(180)  # 3 minutes timeout for page loads
             
             self.wait = WebDriverWait(self.driver, 60)
             
+            ACTIVE_DRIVERS.inc()
+            self.driver_pid = self.driver.service.process.pid
+            active_driver_pids.add(self.driver_pid)
+            self.links_since_restart = 0
+            
             self.logger.info("WebDriver initialized successfully")
             return True
             
@@ -141,6 +217,7 @@ class URLShortener:
             self.logger.error(f"Failed to setup WebDriver: {str(e)}")
             return False
     
+    @timed(LOGIN_SECONDS)
     def login(self):
         """Login to 2ad.ir website"""
         try:
@@ -204,141 +281,379 @@ class URLShortener:
             return False
     
     def read_links_from_files(self):
-        """Read links from input files"""
-        all_links = []
+        """Read links from input files, front-coded and without duplicates"""
+        # Links are deduplicated as they are read, so the inputs are never held as plain strings;
+        # the first spelling of a link is the one shortened
+        unique_links = FrontCodedList()
+        seen = LinkSet()
         
         for file_path in self.config.input_files:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    # Filter out comments and empty lines
-                    links = [line.strip() for line in f.readlines() 
-                            if line.strip() and not line.strip().startswith('#')]
-                    all_links.extend(links)
-                    self.logger.info(f"Read {len(links)} links from {file_path}")
+                # '-' reads stdin to the end; StreamRunner handles stdin link by link instead
+                source = nullcontext(sys.stdin) if file_path == '-' else open(file_path, 'r', encoding='utf-8')
+                with source as f:
+                    count = 0
+                    for line in f:
+                        # Filter out comments and empty lines
+                        link = line.strip()
+                        if not link or link.startswith('#'):
+                            continue
+                        count += 1
+                        if seen.add(self.link_key(link)):
+                            unique_links.append(link)
+                    self.logger.info(f"Read {count} links from {file_path}")
             except Exception as e:
                 self.logger.error(f"Failed to read file {file_path}: {str(e)}")
                 return None
         
-        # Remove duplicates while preserving order
-        unique_links = []
-        seen = set()
-        for link in all_links:
-            if link not in seen:
-                unique_links.append(link)
-                seen.add(link)
-        
         self.logger.info(f"Total unique links to process: {len(unique_links)}")
-        return unique_links[:1000]  # Limit to 1000 links as specified
+        
+        if self.config.preflight:
+            unique_links = self.preflight_links(unique_links, limit=self.config.max_links or None)
+        
+        if self.config.max_links and len(unique_links) > self.config.max_links:
+            self.logger.info(f"Keeping the first {self.config.max_links} links (max_links)")
+            return unique_links[:self.config.max_links]
+        return unique_links
+    
+    def unprocessed(self, links, processed_links):
+        """Links whose canonical form isn't in processed_links, front-coded"""
+        return FrontCodedList(link for link in links if self.link_key(link) not in processed_links)
+    
+    def link_key(self, url):
+        """Canonical form of a link used for dedup and in the checkpoint"""
+        return canonicalize_url(url, self.config.url_normalizations)
+    
+    def preflight_links(self, links, limit=None):
+        """Probe links before shortening; dead ones are dropped, or recorded as DEAD in flag mode
+        
+        With a limit, links are probed in order only until that many usable ones are found,
+        so links past the max_links cap are never probed or flagged.
+        """
+        from link_checker import LinkChecker
+        
+        checker = LinkChecker(
+            self.logger,
+            concurrency=self.config.preflight_concurrency,
+            per_host=self.config.preflight_per_host,
+            timeout=self.config.preflight_timeout,
+            cache_file=os.path.join(self.config.output_dir, 'link_check_cache.json')
+        )
+        usable, dead = [], []
+        start = 0
+        try:
+            with self.tracer.span('preflight', category='batch', links=len(links)):
+                while start < len(links) and (limit is None or len(usable) < limit):
+                    # Probe only as many as are still needed; dead ones among them cost another round
+                    end = len(links) if limit is None else start + limit - len(usable)
+                    chunk_usable, chunk_dead = checker.split(links[start:end])
+                    usable.extend(chunk_usable)
+                    dead.extend(chunk_dead)
+                    start = end
+        finally:
+            checker.close()
+        
+        for url, result in dead:
+            self.logger.warning(f"Dead link ({result['reason']}): {url}")
+            if self.config.preflight == 'flag':
+                self.results_sink.write({
+                    'timestamp': datetime.now().isoformat(),
+                    'original_url': url,
+                    'shortened_url': 'FAILED',
+                    'status': 'DEAD',
+                    'account': self.account_name
+                })
+        
+        action = 'flagged' if self.config.preflight == 'flag' else 'skipped'
+        self.logger.info(f"Pre-flight check: {len(usable)} usable links, {len(dead)} dead links {action}")
+        return usable
     
     def load_checkpoint(self):
         """Load checkpoint data if resume is enabled"""
         if not self.config.resume or not os.path.exists(self.checkpoint_file):
-            return set()
+            return LinkSet()
         
         try:
             with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                processed = set(data.get('processed_links', []))
+                # Re-keyed so checkpoints written before canonicalization, or under another policy, still match
+                processed = LinkSet(self.link_key(link) for link in data.pop('processed_links', []))
+                self.file_offsets = data.get('file_offsets', {})
                 self.logger.info(f"Loaded checkpoint: {len(processed)} processed links")
                 return processed
         except Exception as e:
             self.logger.error(f"Failed to load checkpoint: {str(e)}")
-            return set()
+            return LinkSet()
+    
+    def load_file_offsets(self):
+        """Load only the watch-mode file offsets from the checkpoint, with or without resume"""
+        if not os.path.exists(self.checkpoint_file):
+            return
+        
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                self.file_offsets = json.load(f).get('file_offsets', {})
+            if self.file_offsets:
+                self.logger.info(f"Loaded read positions for {len(self.file_offsets)} watched files")
+        except Exception as e:
+            self.logger.error(f"Failed to load watched file offsets: {str(e)}")
     
     def save_checkpoint(self, processed_links):
         """Save checkpoint data"""
+        with self.tracer.span('checkpoint', category='batch', links=len(processed_links)):
+            # Buffered results must be on disk before their links are marked done, or --resume would skip them
+            try:
+                self.results_sink.flush()
+            except Exception as e:
+                self.logger.error(f"Failed to flush results, checkpoint not saved: {str(e)}")
+                return
+            self._write_checkpoint(processed_links)
+    
+    def _write_checkpoint(self, processed_links):
         try:
-            checkpoint_data = {
-                'processed_links': list(processed_links),
-                'timestamp': datetime.now().isoformat()
-            }
+            checkpoint_data = {'timestamp': datetime.now().isoformat()}
+            if self.file_offsets:
+                checkpoint_data['file_offsets'] = self.file_offsets
             with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint_data, f, ensure_ascii=False, indent=2)
+                # Links are written one at a time so a large LinkSet is never expanded into a list
+                f.write('{\n  "processed_links": [')
+                for index, link in enumerate(processed_links):
+                    f.write(',\n    ' if index else '\n    ')
+                    f.write(json.dumps(link, ensure_ascii=False))
+                f.write('\n  ],\n' if len(processed_links) else '],\n')
+                # The rest of the object, without its opening brace
+                f.write(json.dumps(checkpoint_data, ensure_ascii=False, indent=2)[2:])
         except Exception as e:
             self.logger.error(f"Failed to save checkpoint: {str(e)}")
     
+    @contextmanager
+    def phase(self, step, url=None):
+        """Time one step of shortening a link for metrics and the trace"""
+        with self.tracer.span(step, link=url, attempt=self.current_attempt):
+            with SHORTEN_STEP_SECONDS.labels(step=step).time():
+                yield
+    
     def shorten_url(self, url):
         """Shorten a single URL"""
+        self.command_stats.start_link(url)
+        self.links_since_restart += 1
+        self.last_failure_timeout = False
         try:
             # Click on new link modal button
-            modal_button = self.wait.until(
-                EC.element_to_be_clickable((By.ID, self.selectors['new_link_modal']))
-            )
-            modal_button.click()
-            time.sleep(2)
+            with self.phase('modal', url):
+                modal_button = self.wait.until(
+                    EC.element_to_be_clickable((By.ID, self.selectors['new_link_modal']))
+                )
+                modal_button.click()
+                time.sleep(2)
             
             # Find URL input field and enter URL
-            url_input = self.wait.until(
-                EC.presence_of_element_located((By.ID, self.selectors['url_input']))
-            )
-            url_input.clear()
-            url_input.send_keys(url)
+            with self.phase('input', url):
+                url_input = self.wait.until(
+                    EC.presence_of_element_located((By.ID, self.selectors['url_input']))
+                )
+                url_input.clear()
+                url_input.send_keys(url)
             
             # Click shorten button using XPath
-            shorten_button = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, self.selectors['shorten_button']))
-            )
-            shorten_button.click()
-            
-            # Wait for result
-            time.sleep(3)
-            
-            # Get shortened URL
-            result_field = self.wait.until(
-                EC.presence_of_element_located((By.ID, self.selectors['result_field']))
-            )
-            
-            shortened_url = result_field.get_attribute('value')
-            if not shortened_url:
-                shortened_url = result_field.text
+            with self.phase('submit', url):
+                shorten_button = self.wait.until(
+                    EC.element_to_be_clickable((By.XPATH, self.selectors['shorten_button']))
+                )
+                shorten_button.click()
+            
+            # Wait for result and get shortened URL
+            with self.phase('result', url):
+                time.sleep(3)
+                
+                result_field = self.wait.until(
+                    EC.presence_of_element_located((By.ID, self.selectors['result_field']))
+                )
+                
+                shortened_url = result_field.get_attribute('value')
+                if not shortened_url:
+                    shortened_url = result_field.text
             
             if shortened_url and shortened_url != url:
                 self.logger.debug(f"Successfully shortened: {url} -> {shortened_url}")
                 
                 # Open the shortened URL in a new tab to register the link
-                self.driver.execute_script(f"window.open('{shortened_url}', '_blank');")
-                time.sleep(2)
-                
-                # Close the new tab and return to main window
-                self.driver.switch_to.window(self.driver.window_handles[-1])
-                self.driver.close()
-                self.driver.switch_to.window(self.driver.window_handles[0])
+                if self.register_in_browser:
+                    with self.phase('register', url):
+                        self.driver.execute_script(f"window.open('{shortened_url}', '_blank');")
+                        time.sleep(2)
+                        
+                        # Close the new tab and return to main window
+                        self.driver.switch_to.window(self.driver.window_handles[-1])
+                        self.driver.close()
+                        self.driver.switch_to.window(self.driver.window_handles[0])
                 
+                LINKS_SHORTENED.inc()
                 return shortened_url
             else:
+                if self.is_session_lost():
+                    raise SessionLostError("Redirected to sign-in page")
                 self.logger.warning(f"Failed to shorten URL: {url}")
+                LINKS_FAILED.inc()
                 return None
                 
+        except SessionLostError:
+            raise
         except Exception as e:
+            # A dead driver or expired login is recovered by the caller instead of failing the link
+            if self.is_session_lost(e):
+                raise SessionLostError(str(e)) from e
+            self.last_failure_timeout = isinstance(e, TimeoutException)
             self.logger.error(f"Error shortening URL {url}: {str(e)}")
+            LINKS_FAILED.inc()
             return None
+        finally:
+            commands = self.command_stats.end_link()
+            self.logger.debug(f"WebDriver round trips for {url}: {sum(commands.values())} {commands}")
     
+    @timed(SAVE_RESULT_SECONDS)
     def save_result(self, original_url, shortened_url, success=True):
         """Save result to CSV file"""
+        with self.tracer.span('csv_write', link=original_url, attempt=self.current_attempt):
+            self._write_result(original_url, shortened_url, success)
+    
+    def _write_result(self, original_url, shortened_url, success):
         try:
-            file_exists = os.path.exists(self.results_file)
-            
-            with open(self.results_file, 'a', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['timestamp', 'original_url', 'shortened_url', 'status']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            self.results_sink.write({
+                'timestamp': datetime.now().isoformat(),
+                'original_url': original_url,
+                'shortened_url': shortened_url or 'FAILED',
+                'status': 'SUCCESS' if success else 'FAILED',
+                'account': self.account_name
+            })
+        except Exception as e:
+            self.logger.error(f"Failed to save result: {str(e)}")
+    
+    def wait_if_paused(self):
+        """Block while the circuit breaker is open"""
+        if self.circuit_breaker.is_open:
+            with self.tracer.span('circuit_open', category='session'):
+                self.circuit_breaker.wait_until_closed(self.probe_dashboard)
+    
+    def process_link(self, link, attempt=1):
+        """Shorten one link and record the result, recovering the session if needed
+        
+        Returns (outcome, shortened_url) where outcome is 'success', 'failed',
+        'retry' (queue the link again) or 'stop' (the session could not be recovered).
+        """
+        self.current_attempt = attempt
+        try:
+            with self.tracer.span('link', link=link, attempt=attempt):
+                shortened = self.shorten_url(link)
                 
-                if not file_exists:
-                    writer.writeheader()
+                if shortened:
+                    self.circuit_breaker.record_success()
+                    self.save_result(link, shortened, True)
+                    return 'success', shortened
                 
-                writer.writerow({
-                    'timestamp': datetime.now().isoformat(),
-                    'original_url': original_url,
-                    'shortened_url': shortened_url or 'FAILED',
-                    'status': 'SUCCESS' if success else 'FAILED'
-                })
+                if (self.circuit_breaker.record_failure(timeout=self.last_failure_timeout) and
+                        attempt < self.config.max_link_attempts):
+                    # This failure tripped the breaker; retry the link once the site is back
+                    LINKS_RETRIED.inc()
+                    return 'retry', None
                 
+                self.save_result(link, None, False)
+                return 'failed', None
+            
+        except SessionLostError as e:
+            self.logger.warning(f"Session lost while processing {link}: {str(e)}")
+            
+            if not self.recover_session():
+                self.logger.error("Could not recover WebDriver session")
+                return 'stop', None
+            
+            if attempt < self.config.max_link_attempts:
+                LINKS_RETRIED.inc()
+                return 'retry', None
+            
+            self.save_result(link, None, False)
+            return 'failed', None
+            
         except Exception as e:
-            self.logger.error(f"Failed to save result: {str(e)}")
+            self.logger.error(f"Error processing link {link}: {str(e)}")
+            self.save_result(link, None, False)
+            return 'failed', None
+        finally:
+            self.current_attempt = 1
+    
+    def shorten_many(self, urls, callback=None):
+        """Shorten URLs from any iterable, yielding a result record as each one finishes
+        
+        URLs are pulled one at a time, so a slow consumer holds back the browser instead of
+        results piling up. Retries, the circuit breaker, Chrome recycling every batch_size
+        links and the delay between links are handled here. callback(record) is called
+        before each record is yielded. Raises SessionLostError if the session could not be
+        recovered; the URL in flight is not yielded.
+        """
+        for index, url in enumerate(urls):
+            url = url.strip()
+            if not url:
+                continue
+            
+            if index % self.config.batch_size == 0:
+                recycle_reason = self.get_recycle_reason()
+                if recycle_reason and not self.recycle_driver(recycle_reason):
+                    raise SessionLostError("Could not restart WebDriver")
+            
+            attempt = 1
+            while True:
+                # Don't take new links while 2ad.ir is degraded
+                self.wait_if_paused()
+                
+                wait = self.next_link_at - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                
+                outcome, shortened = self.process_link(url, attempt)
+                self.next_link_at = time.time() + self.config.delay
+                
+                if outcome != 'retry':
+                    break
+                attempt += 1
+            
+            if outcome == 'stop':
+                raise SessionLostError(f"Session could not be recovered while processing {url}")
+            
+            record = {
+                'timestamp': datetime.now().isoformat(),
+                'original_url': url,
+                'shortened_url': shortened,
+                'status': outcome,
+                'attempts': attempt
+            }
+            if callback is not None:
+                callback(record)
+            yield record
+    
+    async def ashorten_many(self, urls, callback=None):
+        """Async iterator variant of shorten_many
+        
+        Selenium calls block, so the work runs on one dedicated thread and the event loop
+        only awaits each finished record.
+        """
+        loop = asyncio.get_running_loop()
+        results = self.shorten_many(urls, callback)
+        done = object()
+        
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='shorten_many') as executor:
+            try:
+                while True:
+                    record = await loop.run_in_executor(executor, next, results, done)
+                    if record is done:
+                        break
+                    yield record
+            finally:
+                await loop.run_in_executor(executor, results.close)
     
     def process_links_in_batches(self, links):
         """Process links in batches"""
         processed_links = self.load_checkpoint()
-        remaining_links = [link for link in links if link not in processed_links]
+        remaining_links = self.unprocessed(links, processed_links)
         
         self.logger.info(f"Processing {len(remaining_links)} remaining links")
         
@@ -351,38 +666,181 @@ class URLShortener:
             batch_num = (i // self.config.batch_size) + 1
             
             self.logger.info(f"Processing batch {batch_num} ({len(batch)} links)")
+            QUEUE_DEPTH.set(len(remaining_links) - i)
             
-            for link in batch:
-                try:
-                    shortened = self.shorten_url(link)
-                    
-                    if shortened:
+            # shorten_many restarts Chrome before the batch once it has grown too large or served enough links
+            session_alive = True
+            try:
+                for record in self.shorten_many(batch):
+                    if record['status'] == 'success':
                         successful += 1
-                        self.save_result(link, shortened, True)
                     else:
                         failed += 1
-                        self.save_result(link, None, False)
                     
-                    processed_links.add(link)
+                    processed_links.add(self.link_key(record['original_url']))
                     total_processed += 1
-                    
-                    # Add delay between requests
-                    time.sleep(self.config.delay)
-                    
-                except Exception as e:
-                    self.logger.error(f"Error processing link {link}: {str(e)}")
-                    failed += 1
-                    processed_links.add(link)
-                    self.save_result(link, None, False)
+            except SessionLostError as e:
+                self.logger.error(str(e))
+                session_alive = False
             
             # Save checkpoint after each batch
             self.save_checkpoint(processed_links)
+            self.write_metrics()
+            self.profiler.on_batch(batch_num)
             
             progress = (total_processed / len(links)) * 100
             self.logger.info(f"Progress: {total_processed}/{len(links)} ({progress:.1f}%) - Success: {successful}, Failed: {failed}")
+            
+            if not session_alive:
+                break
         
+        QUEUE_DEPTH.set(0)
         return successful, failed
     
+    def probe_dashboard(self):
+        """Check whether the dashboard loads and the new-link button is usable"""
+        if not self.is_driver_alive():
+            self.cleanup()
+            if not self.setup_driver():
+                return False
+        
+        self.driver.get(self.selectors['dashboard_url'])
+        if '/auth/signin' in self.driver.current_url and not self.login():
+            return False
+        
+        WebDriverWait(self.driver, 15).until(
+            EC.element_to_be_clickable((By.ID, self.selectors['new_link_modal']))
+        )
+        return True
+    
+    def is_driver_alive(self):
+        """Check that ChromeDriver and Chrome still answer commands"""
+        if not self.driver:
+            return False
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+    
+    def is_session_lost(self, error=None):
+        """Check whether an error or the current page means the driver died or we were logged out"""
+        if isinstance(error, InvalidSessionIdException):
+            return True
+        
+        message = str(error).lower() if error is not None else ''
+        if any(marker in message for marker in DEAD_DRIVER_MARKERS):
+            return True
+        
+        try:
+            return '/auth/signin' in self.driver.current_url
+        except Exception:
+            # The driver can't even report its URL, so it is gone
+            return True
+    
+    def recover_session(self):
+        """Respawn a dead driver or log in again after the session expired"""
+        if self.recoveries >= self.config.max_recoveries:
+            self.logger.error(f"Reached the limit of {self.config.max_recoveries} session recoveries")
+            return False
+        
+        self.recoveries += 1
+        driver_alive = self.is_driver_alive()
+        cause = 'login' if driver_alive else 'driver'
+        SESSION_RECOVERIES.labels(cause=cause).inc()
+        self.logger.info(f"Recovering session ({cause}), recovery #{self.recoveries}")
+        
+        with self.tracer.span('recover_session', category='session', cause=cause):
+            if not driver_alive:
+                self.cleanup()
+                if not self.setup_driver():
+                    return False
+            
+            return self.login()
+    
+    def get_recycle_reason(self):
+        """Return why the driver should be restarted, or None if it is fine"""
+        if self.config.recycle_after_links and self.links_since_restart >= self.config.recycle_after_links:
+            return 'links'
+        
+        if self.config.recycle_rss_mb and self.driver_pid:
+            rss_mb = get_process_tree_rss(self.driver_pid) / (1024 * 1024)
+            if rss_mb >= self.config.recycle_rss_mb:
+                self.logger.info(f"Chrome memory use is {rss_mb:.0f} MB")
+                return 'memory'
+        
+        return None
+    
+    def restore_session(self, cookies):
+        """Restore a logged-in session in a fresh driver from saved cookies"""
+        try:
+            # Cookies can only be set for the domain currently loaded
+            self.driver.get("https://2ad.ir/")
+            for cookie in cookies:
+                try:
+                    self.driver.add_cookie(cookie)
+                except Exception as e:
+                    self.logger.debug(f"Could not restore cookie {cookie.get('name')}: {str(e)}")
+            
+            self.driver.get(self.selectors['dashboard_url'])
+            return self.selectors['dashboard_url'] in self.driver.current_url
+            
+        except Exception as e:
+            self.logger.warning(f"Failed to restore session from cookies: {str(e)}")
+            return False
+    
+    def recycle_driver(self, reason):
+        """Restart Chrome and restore the session, logging in again only if needed"""
+        self.logger.info(f"Recycling WebDriver ({reason}) after {self.links_since_restart} links")
+        DRIVER_RECYCLES.labels(reason=reason).inc()
+        
+        try:
+            cookies = self.driver.get_cookies()
+        except Exception as e:
+            self.logger.warning(f"Could not read cookies before restart: {str(e)}")
+            cookies = []
+        
+        self.cleanup()
+        
+        with self.tracer.span('recycle_driver', category='session', reason=reason):
+            if not self.setup_driver():
+                return False
+            
+            if cookies and self.restore_session(cookies):
+                self.logger.info("Session restored without login")
+                return True
+            
+            self.logger.info("Session restore failed, logging in again")
+            return self.login()
+    
+    def save_command_report(self):
+        """Log the WebDriver command summary and save it next to the results"""
+        self.command_stats.log_summary(self.logger)
+        
+        report_file = self.output_stem + '_webdriver.json'
+        try:
+            self.command_stats.save(report_file)
+            self.logger.info(f"WebDriver command report saved to: {report_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to save WebDriver command report: {str(e)}")
+    
+    def write_metrics(self):
+        """Write metrics to the textfile exporter path, if configured"""
+        if not self.config.metrics_file:
+            return
+        
+        try:
+            REGISTRY.write_textfile(self.config.metrics_file)
+        except Exception as e:
+            self.logger.error(f"Failed to write metrics file: {str(e)}")
+    
+    def close_outputs(self):
+        """Close the results sink and tracer if this instance created them"""
+        if self.owns_results_sink:
+            self.results_sink.close()
+        if self.owns_tracer:
+            self.tracer.close()
+    
     def cleanup(self):
         """Cleanup resources"""
         if self.driver:
@@ -391,17 +849,32 @@ class URLShortener:
                 self.logger.info("WebDriver closed successfully")
             except Exception as e:
                 self.logger.error(f"Error closing WebDriver: {str(e)}")
+            finally:
+                if self.driver_pid is not None:
+                    ACTIVE_DRIVERS.dec()
+                    active_driver_pids.discard(self.driver_pid)
+                self.driver = None
+                self.driver_pid = None
     
     def run(self):
         """Main execution method"""
+        try:
+            return self.profiler.profile_call(self._run)
+        finally:
+            self.profiler.finish()
+    
+    def _run(self):
+        """Setup, login and process all links"""
         try:
             # Setup WebDriver
-            if not self.setup_driver():
-                return False
+            with self.tracer.span('setup_driver', category='session'):
+                if not self.setup_driver():
+                    return False
             
             # Login to website
-            if not self.login():
-                return False
+            with self.tracer.span('login', category='session'):
+                if not self.login():
+                    return False
             
             # Read links from files
             links = self.read_links_from_files()
@@ -415,7 +888,10 @@ class URLShortener:
             # Final summary
             total = successful + failed
             self.logger.info(f"Processing completed: {successful} successful, {failed} failed out of {total} total")
+            if self.recoveries:
+                self.logger.info(f"Recovered from {self.recoveries} driver crashes or expired sessions")
             self.logger.info(f"Results saved to: {self.results_file}")
+            self.save_command_report()
             
             return successful > 0
             
@@ -424,3 +900,5 @@ class URLShortener:
             return False
         finally:
             self.cleanup()
+            self.write_metrics()
+            self.close_outputs()
@@ -5,12 +5,15 @@ Utility functions for URL shortener application
 """
 
 import os
+import re
 import logging
 import sys
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, quote
 
-def setup_logging(level=logging.INFO):
-    """Setup logging configuration"""
+def setup_logging(level=logging.INFO, stream=None):
+    """Setup logging configuration; console output goes to stream (stdout unless given)"""
     
     # Create logs directory if it doesn't exist
     os.makedirs('logs', exist_ok=True)
@@ -24,7 +27,7 @@ def setup_logging(level=logging.INFO):
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
             logging.FileHandler(log_filename, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
+            logging.StreamHandler(stream or sys.stdout)
         ]
     )
     
@@ -33,15 +36,19 @@ def setup_logging(level=logging.INFO):
     
     return logger
 
-def validate_files(file_paths):
-    """Validate that input files exist and are readable"""
+def validate_files(file_paths, stream=None):
+    """Validate that input files exist and are readable; '-' (stdin) is not checked"""
+    stream = stream or sys.stdout
     for file_path in file_paths:
+        if file_path == '-':
+            continue
+        
         if not os.path.exists(file_path):
-            print(f"Error: File not found: {file_path}")
+            print(f"Error: File not found: {file_path}", file=stream)
             return False
         
         if not os.path.isfile(file_path):
-            print(f"Error: Path is not a file: {file_path}")
+            print(f"Error: Path is not a file: {file_path}", file=stream)
             return False
         
         try:
@@ -49,26 +56,88 @@ def validate_files(file_paths):
                 # Try to read and count non-comment lines
                 lines = [line.strip() for line in f.readlines() if line.strip() and not line.strip().startswith('#')]
                 if len(lines) == 0:
-                    print(f"Warning: No valid URLs found in {file_path}")
+                    print(f"Warning: No valid URLs found in {file_path}", file=stream)
                 else:
-                    print(f"Found {len(lines)} URLs in {file_path}")
+                    print(f"Found {len(lines)} URLs in {file_path}", file=stream)
         except Exception as e:
-            print(f"Error: Cannot read file {file_path}: {e}")
+            print(f"Error: Cannot read file {file_path}: {e}", file=stream)
             return False
     
     return True
 
-def is_valid_url(url):
-    """Basic URL validation"""
+def is_valid_url(url, check_alive=False, timeout=10):
+    """Basic URL validation, optionally also probing that the link is not dead"""
     if not url or not isinstance(url, str):
         return False
     
     url = url.strip()
     
     # Basic URL pattern check
-    return (url.startswith('http://') or 
-            url.startswith('https://') or 
-            url.startswith('ftp://')) and len(url) > 10
+    valid = (url.startswith('http://') or 
+             url.startswith('https://') or 
+             url.startswith('ftp://')) and len(url) > 10
+    
+    if not valid or not check_alive or url.startswith('ftp://'):
+        return valid
+    
+    # Only a definite 404/410 or unreachable host fails; timeouts and other errors pass
+    from link_checker import check_link
+    return check_link(url, timeout=timeout)['alive'] is not False
+
+# Normalizations canonicalize_url can apply; 'fragment' is off by default because some
+# file hosts (mega.nz) keep the decryption key in the fragment
+URL_NORMALIZATIONS = ('host', 'port', 'percent_encoding', 'trailing_slash', 'fragment')
+DEFAULT_URL_NORMALIZATIONS = ('host', 'port', 'percent_encoding', 'trailing_slash')
+
+DEFAULT_PORTS = {'http': '80', 'https': '443', 'ftp': '21'}
+
+# RFC 3986 unreserved characters never need escaping; reserved ones keep their escapes
+UNRESERVED_CHARACTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+PERCENT_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+def _normalize_escapes(component, safe):
+    """Escape raw unsafe characters, decode escaped unreserved ones and uppercase the rest"""
+    component = quote(component, safe=safe + '%')
+    
+    def replace(match):
+        character = chr(int(match.group(1), 16))
+        return character if character in UNRESERVED_CHARACTERS else '%' + match.group(1).upper()
+    
+    return PERCENT_ESCAPE.sub(replace, component)
+
+@lru_cache(maxsize=65536)
+def canonicalize_url(url, normalizations=DEFAULT_URL_NORMALIZATIONS):
+    """Canonical form of a URL for dedup, checkpoint and lookup keys; output keeps the original string"""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    
+    netloc, path, query, fragment = parts.netloc, parts.path, parts.query, parts.fragment
+    
+    userinfo, at, hostport = netloc.rpartition('@')
+    if hostport.rfind(':') > hostport.rfind(']'):
+        host, port = hostport.rsplit(':', 1)
+    else:
+        host, port = hostport, ''
+    if 'host' in normalizations:
+        host = host.lower()
+    if 'port' in normalizations and port in ('', DEFAULT_PORTS.get(parts.scheme)):
+        port = ''
+    netloc = f"{userinfo}{at}{host}{':' if port else ''}{port}"
+    
+    if 'percent_encoding' in normalizations:
+        path = _normalize_escapes(path, "/:@!$&'()*+,;=")
+        query = _normalize_escapes(query, "/?:@!$&'()*+,;=")
+    
+    if 'trailing_slash' in normalizations and netloc:
+        path = path.rstrip('/') or '/'
+    
+    if 'fragment' in normalizations:
+        fragment = ''
+    
+    return urlunsplit((parts.scheme, netloc, path, query, fragment))
 
 def sanitize_filename(filename):
     """Sanitize filename for safe file operations"""
@@ -128,3 +197,82 @@ def count_lines_in_file(file_path):
             return sum(1 for _ in f)
     except Exception:
         return 0
+
+def get_process_tree_rss(pid):
+    """Get resident memory in bytes of a process and all its descendants"""
+    try:
+        import psutil
+        
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+        total = 0
+        for proc in processes:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    
+    # Fallback for Linux without psutil: walk /proc for the parent-child tree
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', 'r') as f:
+                    # The command name may contain spaces, so split after its closing paren
+                    fields = f.read().rsplit(')', 1)[1].split()
+                children.setdefault(int(fields[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    except OSError:
+        return 0
+    
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (OSError, ValueError):
+            continue
+    
+    return total
+
+def get_host_load():
+    """Get host CPU use (0-1) and available memory in bytes; either is None when it can't be measured"""
+    try:
+        import psutil
+        
+        # Usage since the previous call, so sampling once per tuning interval covers the whole interval
+        return psutil.cpu_percent(interval=None) / 100, psutil.virtual_memory().available
+    except ImportError:
+        pass
+    
+    # Fallback without psutil: 1-minute load average per CPU (Unix only) and MemAvailable (Linux only)
+    try:
+        cpu = min(os.getloadavg()[0] / (os.cpu_count() or 1), 1.0)
+    except (AttributeError, OSError):
+        cpu = None
+    
+    available = None
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    
+    return cpu, available
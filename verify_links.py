@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verification of shortened links
+Resolves every short link in result CSVs and checks that it lands on the original URL
+"""
+
+import os
+import sys
+import csv
+import logging
+import argparse
+import threading
+from collections import deque, Counter
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from link_checker import create_session, HEAD_UNSUPPORTED_CODES
+from utils import canonicalize_url, URL_NORMALIZATIONS
+
+VERIFY_FIELDS = ['verified', 'final_url']
+
+def same_target(final_url, original_url):
+    """Compare canonical forms, ignoring the scheme and fragment that redirects may change"""
+    final = urlsplit(canonicalize_url(final_url, URL_NORMALIZATIONS))
+    original = urlsplit(canonicalize_url(original_url, URL_NORMALIZATIONS))
+    return final[1:] == original[1:]
+
+class LinkVerifier:
+    """Follows short links' redirects with HEAD requests (bodies are never downloaded)"""
+    
+    def __init__(self, logger, concurrency=32, timeout=15):
+        self.logger = logger
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = create_session(concurrency)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+    
+    def resolve(self, short_url):
+        """Return (final_url, status_code) after following redirects"""
+        response = self.session.head(short_url, timeout=self.timeout, allow_redirects=True)
+        if response.status_code in HEAD_UNSUPPORTED_CODES:
+            response = self.session.get(short_url, timeout=self.timeout, allow_redirects=True, stream=True)
+            response.close()
+        return response.url, response.status_code
+    
+    def verify_row(self, row):
+        """Add the verified and final_url columns to one result row"""
+        row = dict(row)
+        short_url = row.get('shortened_url')
+        
+        if row.get('status') != 'SUCCESS' or not short_url or short_url == 'FAILED':
+            row['verified'] = ''
+            row['final_url'] = ''
+            return row
+        
+        try:
+            final_url, status = self.resolve(short_url)
+            row['final_url'] = final_url
+            if status >= 400:
+                row['verified'] = 'broken'
+            elif same_target(final_url, row['original_url']):
+                row['verified'] = 'yes'
+            else:
+                row['verified'] = 'no'
+        except requests.RequestException as e:
+            self.logger.debug(f"Could not resolve {short_url}: {str(e)}")
+            row['final_url'] = ''
+            row['verified'] = 'error'
+        
+        with self.lock:
+            self.counts[row['verified']] += 1
+        return row
+    
+    def verify_rows(self, rows):
+        """Verify rows concurrently, yielding them in input order with a bounded number in flight"""
+        window = self.concurrency * 4
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='verify') as executor:
+            pending = deque()
+            for row in rows:
+                pending.append(executor.submit(self.verify_row, row))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def verify_file(self, input_path, output_path=None):
+        """Write a copy of a results CSV with verified and final_url columns; returns the output path"""
+        if output_path is None:
+            root, ext = os.path.splitext(input_path)
+            output_path = f'{root}_verified{ext or ".csv"}'
+        
+        with open(input_path, 'r', newline='', encoding='utf-8') as infile:
+            reader = csv.DictReader(infile)
+            fieldnames = list(reader.fieldnames or [])
+            fieldnames += [field for field in VERIFY_FIELDS if field not in fieldnames]
+            
+            temp_path = f'{output_path}.tmp'
+            with open(temp_path, 'w', newline='', encoding='utf-8') as outfile:
+                writer = csv.DictWriter(outfile, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                for index, row in enumerate(self.verify_rows(reader), 1):
+                    writer.writerow(row)
+                    if index % 1000 == 0:
+                        self.logger.info(f"Verified {index} rows of {input_path}")
+        os.replace(temp_path, output_path)
+        
+        return output_path
+    
+    def summary(self):
+        with self.lock:
+            return dict(self.counts)
+    
+    def close(self):
+        self.session.close()
+
+def verify_results_file(path, logger, concurrency=32, output_path=None):
+    """Verify one results CSV and log the outcome; used after a run with --verify"""
+    verifier = LinkVerifier(logger, concurrency=concurrency)
+    try:
+        output_path = verifier.verify_file(path, output_path)
+        counts = verifier.summary()
+        logger.info(f"Verification of {path}: {counts.get('yes', 0)} verified, {counts.get('no', 0)} wrong target, "
+                    f"{counts.get('broken', 0)} broken, {counts.get('error', 0)} errors - saved to {output_path}")
+        return output_path
+    finally:
+        verifier.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify that shortened links redirect to their original URLs')
+    parser.add_argument('files', nargs='+', help='shortened_urls_*.csv result files')
+    parser.add_argument('--output', help='Output file (only with a single input file; default: <input>_verified.csv)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent requests')
+    parser.add_argument('--timeout', type=float, default=15, help='Per-request timeout in seconds')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Verbose logging')
+    args = parser.parse_args()
+    
+    if args.output and len(args.files) > 1:
+        parser.error('--output can only be used with a single input file')
+    
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger('verify_links')
+    
+    verifier = LinkVerifier(logger, concurrency=args.concurrency, timeout=args.timeout)
+    try:
+        for path in args.files:
+            output_path = verifier.verify_file(path, args.output)
+            logger.info(f"Saved {output_path}")
+    finally:
+        verifier.close()
+    
+    counts = verifier.summary()
+    logger.info(f"Verified: {counts.get('yes', 0)}, wrong target: {counts.get('no', 0)}, "
+                f"broken: {counts.get('broken', 0)}, errors: {counts.get('error', 0)}")
+    return 0 if not (counts.get('no') or counts.get('broken')) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
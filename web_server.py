@@ -11,17 +11,21 @@ import json
 import time
 import csv
 import logging
+import zlib
 from datetime import datetime
-from io import StringIO
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import threading
 from queue import Queue
 import tempfile
 
 # Import our existing modules
-from url_shortener import URLShortener
+from url_shortener import URLShortener, SessionLostError
 from config import Config
-from utils import setup_logging
+from session_pool import SessionPool, LatencyTracker
+from results_store import ResultsStore, DEFAULT_RESULTS_DB
+from link_store import FrontCodedList, ResultBuffer
+from metrics import REGISTRY, QUEUE_DEPTH
+from utils import setup_logging, is_valid_url, canonicalize_url
 
 app = Flask(__name__)
 app.secret_key = 'url_shortener_secret_key_2ad_ir'
@@ -31,6 +35,104 @@ processing_queue = Queue()
 processing_status = {}
 results_storage = {}
 
+# Per-job change notification used by the SSE progress stream
+job_events = {}
+job_events_lock = threading.Lock()
+
+# Seconds between SSE heartbeat comments while a job is idle
+SSE_HEARTBEAT_INTERVAL = 15
+
+# Synchronous /api/shorten settings
+API_MAX_URLS = int(os.environ.get('API_MAX_URLS', 20))
+session_pool = None
+session_pool_lock = threading.Lock()
+
+# Consolidated results for /api/lookup; result CSVs are re-scanned at most this often
+RESULTS_DB = os.environ.get('RESULTS_DB', DEFAULT_RESULTS_DB)
+# URL matching policy from config.json, the same one the shortener jobs load
+LINK_NORMALIZATIONS = Config().url_normalizations
+RESULTS_REFRESH_INTERVAL = int(os.environ.get('RESULTS_REFRESH_INTERVAL', 30))
+results_store = None
+results_store_lock = threading.Lock()
+results_refreshed_at = 0
+api_latency = LatencyTracker()
+
+def count_pending_urls():
+    """URLs in queued or running jobs that have not been processed yet"""
+    return sum(
+        job['total_urls'] - job['processed_urls']
+        for job in list(processing_status.values())
+        if job['status'] in ('queued', 'processing')
+    )
+
+QUEUE_DEPTH.set_function(count_pending_urls)
+
+def get_session_pool():
+    """Create the shared warm session pool on first use"""
+    global session_pool
+    with session_pool_lock:
+        if session_pool is None:
+            session_pool = SessionPool(
+                setup_logging(logging.INFO),
+                max_sessions_per_account=int(os.environ.get('API_SESSIONS_PER_ACCOUNT', 2)),
+                idle_timeout=int(os.environ.get('API_SESSION_IDLE_TIMEOUT', 900))
+            )
+            session_pool.start_maintenance()
+        return session_pool
+
+def prewarm_session_pool():
+    """Log in the account from the environment before the first API call"""
+    username = os.environ.get('SHORTEN_API_USERNAME')
+    password = os.environ.get('SHORTEN_API_PASSWORD')
+    if username and password:
+        get_session_pool().prewarm(username, password)
+
+class JobEvents:
+    """Condition variable plus version counter for one job's updates"""
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+
+def get_job_events(job_id):
+    """Get (or create) the change notifier for a job"""
+    with job_events_lock:
+        events = job_events.get(job_id)
+        if events is None:
+            events = JobEvents()
+            job_events[job_id] = events
+        return events
+
+def notify_job_update(job_id):
+    """Wake up every SSE stream watching this job"""
+    events = get_job_events(job_id)
+    with events.condition:
+        events.version += 1
+        events.condition.notify_all()
+
+def get_job_progress(job):
+    """Counter snapshot pushed to clients as a progress event"""
+    total = job['total_urls']
+    return {
+        'status': job['status'],
+        'total_urls': total,
+        'processed_urls': job['processed_urls'],
+        'successful_urls': job['successful_urls'],
+        'failed_urls': job['failed_urls'],
+        'progress': (job['processed_urls'] / total) * 100 if total > 0 else 0,
+        'error': job.get('error')
+    }
+
+def format_sse(data, event=None, event_id=None):
+    """Format one Server-Sent Events message"""
+    message = ''
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    if event:
+        message += f'event: {event}\n'
+    message += f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+    return message
+
 @app.route('/')
 def index():
     """Main page"""
@@ -52,7 +154,11 @@ def upload_urls():
             return jsonify({'error': 'نام کاربری و رمز عبور الزامی است'}), 400
         
         # Process URLs
-        urls = [url.strip() for url in urls_text.split('\n') if url.strip()]
+        urls = [url.strip() for url in urls_text.split('\n') if url.strip() and not url.strip().startswith('#')]
+        unique_urls = {}
+        for url in urls:
+            unique_urls.setdefault(canonicalize_url(url, LINK_NORMALIZATIONS), url)
+        urls = FrontCodedList(unique_urls.values())
         
         if not urls:
             return jsonify({'error': 'لطفاً حداقل یک URL وارد کنید'}), 400
@@ -63,18 +169,12 @@ def upload_urls():
         # Create processing job
         job_id = f"job_{int(time.time())}"
         
-        # Save URLs to temporary file
-        temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt')
-        for url in urls:
-            temp_file.write(url + '\n')
-        temp_file.close()
-        
         # Create job configuration
         job_config = {
             'job_id': job_id,
             'username': username,
             'password': password,
-            'input_file': temp_file.name,
+            'urls': urls,
             'batch_size': batch_size,
             'delay': delay,
             'total_urls': len(urls),
@@ -83,7 +183,8 @@ def upload_urls():
             'failed_urls': 0,
             'status': 'queued',
             'created_at': datetime.now().isoformat(),
-            'results': []
+            # Front-coded rows; a job's URLs usually differ only in their file names
+            'results': ResultBuffer()
         }
         
         # Add to queue and status tracking
@@ -113,6 +214,8 @@ def get_status(job_id):
         return jsonify({'error': 'کار یافت نشد'}), 404
     
     status = processing_status[job_id].copy()
+    status.pop('urls', None)
+    status['results'] = status['results'].to_list()
     
     # Calculate progress
     if status['total_urls'] > 0:
@@ -122,41 +225,250 @@ def get_status(job_id):
     
     return jsonify(status)
 
+@app.route('/events/<job_id>')
+def stream_events(job_id):
+    """Stream job progress and result rows as Server-Sent Events"""
+    if job_id not in processing_status:
+        return jsonify({'error': 'کار یافت نشد'}), 404
+    
+    # Event ids are result row counts, so a reconnecting client resumes after the last row it saw
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0)
+    try:
+        start_index = max(int(last_event_id), 0)
+    except ValueError:
+        start_index = 0
+    
+    def generate():
+        events = get_job_events(job_id)
+        sent = start_index
+        last_progress = None
+        
+        yield 'retry: 3000\n\n'
+        
+        while True:
+            with events.condition:
+                version = events.version
+            
+            job = processing_status.get(job_id)
+            if job is None:
+                return
+            
+            results = job['results']
+            while sent < len(results):
+                sent += 1
+                yield format_sse(results[sent - 1], event='result', event_id=sent)
+            
+            progress = get_job_progress(job)
+            if progress != last_progress:
+                yield format_sse(progress, event='progress', event_id=sent)
+                last_progress = progress
+            
+            if job['status'] in ('completed', 'failed'):
+                yield format_sse(progress, event='done', event_id=sent)
+                return
+            
+            # Sleep until the worker records something new, sending a heartbeat when idle
+            with events.condition:
+                changed = events.condition.wait_for(
+                    lambda: events.version != version, timeout=SSE_HEARTBEAT_INTERVAL
+                )
+            if not changed:
+                yield ': heartbeat\n\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/download/<job_id>')
 def download_results(job_id):
-    """Download results as CSV"""
+    """Download results as CSV, streamed row by row"""
     if job_id not in processing_status:
         return jsonify({'error': 'کار یافت نشد'}), 404
     
     job = processing_status[job_id]
+    partial = request.args.get('partial') == '1'
     
-    if job['status'] != 'completed':
+    if job['status'] != 'completed' and not partial:
         return jsonify({'error': 'کار هنوز تکمیل نشده'}), 400
     
-    # Create CSV content
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Original URL', 'Shortened URL', 'Status', 'Processed Time'])
+    # Only rows recorded so far are sent, even if the job keeps running
+    row_count = len(job['results'])
+    use_gzip = (request.args.get('gzip') == '1' and
+                'gzip' in request.headers.get('Accept-Encoding', ''))
+    
+    rows = generate_csv_rows(job['results'], row_count)
+    if use_gzip:
+        rows = gzip_stream(rows)
+    
+    headers = {
+        'Content-Disposition': f'attachment; filename=shortened_urls_{job_id}'
+                               f'{"" if job["status"] == "completed" else "_partial"}.csv',
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    
+    return Response(stream_with_context(rows), mimetype='text/csv', headers=headers)
+
+class CSVLineBuffer:
+    """File-like object that hands each CSV line back instead of storing it"""
+    
+    def write(self, value):
+        return value
+
+def generate_csv_rows(results, row_count):
+    """Yield the CSV header and result rows one line at a time"""
+    writer = csv.writer(CSVLineBuffer())
+    yield writer.writerow(['Original URL', 'Shortened URL', 'Status', 'Processed Time'])
     
-    for result in job['results']:
-        writer.writerow([
+    for index in range(row_count):
+        result = results[index]
+        yield writer.writerow([
             result['original_url'],
             result['shortened_url'],
             result['status'],
             result['processed_time']
         ])
+
+def gzip_stream(chunks, flush_every=64 * 1024):
+    """Gzip-compress a stream of text chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
     
-    # Create temporary file for download
-    temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv')
-    temp_file.write(output.getvalue())
-    temp_file.close()
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending += len(data)
+        compressed = compressor.compress(data)
+        
+        # Flush periodically so the client sees progress on large downloads
+        if pending >= flush_every:
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        
+        if compressed:
+            yield compressed
     
-    return send_file(
-        temp_file.name,
-        as_attachment=True,
-        download_name=f'shortened_urls_{job_id}.csv',
-        mimetype='text/csv'
-    )
+    yield compressor.flush()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/shorten', methods=['POST'])
+def api_shorten():
+    """Shorten a few URLs synchronously using a warm, logged-in session"""
+    started = time.time()
+    data = request.get_json(silent=True) or {}
+    
+    username = data.get('username')
+    password = data.get('password')
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    
+    if not username or not password:
+        return jsonify({'error': 'نام کاربری و رمز عبور الزامی است'}), 400
+    
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'لطفاً حداقل یک URL وارد کنید'}), 400
+    
+    if len(urls) > API_MAX_URLS:
+        return jsonify({'error': f'حداکثر {API_MAX_URLS} URL در هر درخواست'}), 400
+    
+    pool = get_session_pool()
+    session = pool.acquire(username, password)
+    if session is None:
+        return jsonify({'error': 'نشست فعالی برای این حساب در دسترس نیست'}), 503
+    
+    results = []
+    healthy = False
+    try:
+        for url in urls:
+            url = str(url).strip()
+            if not is_valid_url(url):
+                results.append({'original_url': url, 'shortened_url': None, 'status': 'invalid'})
+                continue
+            
+            try:
+                shortened = session.shortener.shorten_url(url)
+            except SessionLostError:
+                # Respawn or log in again once, then retry the link
+                if not session.shortener.recover_session():
+                    raise
+                shortened = session.shortener.shorten_url(url)
+            session.links_served += 1
+            results.append({
+                'original_url': url,
+                'shortened_url': shortened,
+                'status': 'success' if shortened else 'failed'
+            })
+        
+        healthy = pool.is_healthy(session)
+    except Exception as e:
+        return jsonify({'error': f'خطا در پردازش: {str(e)}'}), 500
+    finally:
+        pool.release(session, healthy)
+    
+    elapsed = time.time() - started
+    api_latency.record(elapsed)
+    
+    return jsonify({'results': results, 'elapsed_ms': round(elapsed * 1000, 1)})
+
+def get_results_store():
+    """Open the results store on first use and import new result CSVs when the last scan is stale"""
+    global results_store, results_refreshed_at
+    with results_store_lock:
+        if results_store is None:
+            results_store = ResultsStore(RESULTS_DB, url_normalizations=LINK_NORMALIZATIONS)
+        if time.time() - results_refreshed_at >= RESULTS_REFRESH_INTERVAL:
+            results_store.consolidate(output_dir=os.path.dirname(RESULTS_DB) or '.')
+            results_refreshed_at = time.time()
+        return results_store
+
+@app.route('/api/lookup', methods=['GET', 'POST'])
+def api_lookup():
+    """Short links already made for URLs: ?url=... (repeatable), a JSON urls list or an uploaded links file"""
+    started = time.time()
+    
+    if request.method == 'GET':
+        urls = request.args.getlist('url')
+    elif 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8', errors='replace')
+        urls = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    else:
+        data = request.get_json(silent=True) or {}
+        urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'لطفاً حداقل یک URL وارد کنید'}), 400
+    
+    urls = [str(url).strip() for url in urls]
+    found = get_results_store().lookup_many(urls)
+    results = [
+        {'original_url': url, 'shortened_url': found[url]['shortened_url'], 'timestamp': found[url]['timestamp']}
+        if url in found else {'original_url': url, 'shortened_url': None, 'timestamp': None}
+        for url in urls
+    ]
+    
+    return jsonify({
+        'results': results,
+        'found': sum(1 for url in urls if url in found),
+        'elapsed_ms': round((time.time() - started) * 1000, 1)
+    })
+
+@app.route('/api/shorten/stats')
+def api_shorten_stats():
+    """Latency percentiles and pool state for /api/shorten"""
+    return jsonify({
+        'latency': api_latency.summary(),
+        'pool': get_session_pool().stats(),
+        'max_urls': API_MAX_URLS
+    })
 
 def process_urls_worker():
     """Background worker to process URLs"""
@@ -171,64 +483,67 @@ def process_urls_worker():
             job_id = job['job_id']
             processing_status[job_id]['status'] = 'processing'
             processing_status[job_id]['started_at'] = datetime.now().isoformat()
+            notify_job_update(job_id)
             
             # Setup logging for this job
             logger = setup_logging(logging.INFO)
             
+            shortener = None
             try:
                 # Create config
                 config = Config(
                     username=job['username'],
                     password=job['password'],
-                    input_files=[job['input_file']],
                     output_dir=tempfile.gettempdir(),
                     batch_size=job['batch_size'],
                     delay=job['delay'],
                     headless=True,
-                    resume=False
+                    resume=False,
+                    url_normalizations=LINK_NORMALIZATIONS
                 )
                 
                 # Initialize URL shortener
                 shortener = URLShortener(config, logger)
                 
-                # Override methods to track progress
-                original_shorten_url = shortener.shorten_url
-                
-                def track_progress_shorten_url(url):
-                    result = original_shorten_url(url)
+                if not shortener.setup_driver() or not shortener.login():
+                    processing_status[job_id]['status'] = 'failed'
+                    processing_status[job_id]['error'] = 'ورود به حساب 2ad.ir ناموفق بود'
+                else:
+                    # Results arrive one by one as each URL finishes
+                    for record in shortener.shorten_many(job['urls']):
+                        processing_status[job_id]['processed_urls'] += 1
+                        
+                        if record['status'] == 'success':
+                            processing_status[job_id]['successful_urls'] += 1
+                            shortened_url = record['shortened_url']
+                        else:
+                            processing_status[job_id]['failed_urls'] += 1
+                            shortened_url = 'خطا در کوتاه‌سازی'
+                        
+                        # Add to results
+                        processing_status[job_id]['results'].append({
+                            'original_url': record['original_url'],
+                            'shortened_url': shortened_url,
+                            'status': record['status'],
+                            'processed_time': record['timestamp']
+                        })
+                        notify_job_update(job_id)
                     
-                    # Update progress
-                    processing_status[job_id]['processed_urls'] += 1
+                    # Web results land in the temp dir, so add them to the lookup store directly
+                    try:
+                        results = processing_status[job_id]['results']
+                        get_results_store().add_records(
+                            ({**row, 'timestamp': row['processed_time']} for row in results),
+                            source=f'web job {job_id}'
+                        )
+                    except Exception as e:
+                        logger.warning(f"Could not store results of job {job_id}: {str(e)}")
                     
-                    if result:
-                        processing_status[job_id]['successful_urls'] += 1
-                        status = 'success'
-                        shortened_url = result
+                    # Update final status
+                    if processing_status[job_id]['successful_urls'] > 0:
+                        processing_status[job_id]['status'] = 'completed'
                     else:
-                        processing_status[job_id]['failed_urls'] += 1
-                        status = 'failed'
-                        shortened_url = 'خطا در کوتاه‌سازی'
-                    
-                    # Add to results
-                    processing_status[job_id]['results'].append({
-                        'original_url': url,
-                        'shortened_url': shortened_url,
-                        'status': status,
-                        'processed_time': datetime.now().isoformat()
-                    })
-                    
-                    return result
-                
-                shortener.shorten_url = track_progress_shorten_url
-                
-                # Run the shortener
-                success = shortener.run()
-                
-                # Update final status
-                if success:
-                    processing_status[job_id]['status'] = 'completed'
-                else:
-                    processing_status[job_id]['status'] = 'failed'
+                        processing_status[job_id]['status'] = 'failed'
                 
             except Exception as e:
                 logger.error(f"Processing error for job {job_id}: {str(e)}")
@@ -236,11 +551,11 @@ def process_urls_worker():
                 processing_status[job_id]['error'] = str(e)
             
             finally:
+                if shortener is not None:
+                    shortener.cleanup()
+                    shortener.close_outputs()
                 processing_status[job_id]['completed_at'] = datetime.now().isoformat()
-                
-                # Clean up temporary file
-                if os.path.exists(job['input_file']):
-                    os.unlink(job['input_file'])
+                notify_job_update(job_id)
             
             processing_queue.task_done()
             
@@ -248,6 +563,10 @@ def process_urls_worker():
             print(f"Worker error: {e}")
             break
 
+# Warm up the API session pool in the background when credentials are configured
+if os.environ.get('SHORTEN_API_USERNAME'):
+    threading.Thread(target=prewarm_session_pool, daemon=True).start()
+
 if __name__ == '__main__':
     # Create templates directory and template
     os.makedirs('templates', exist_ok=True)
@@ -276,6 +595,9 @@ if __name__ == '__main__':
         .progress-bar { height: 100%; background: #007bff; transition: width 0.3s; }
         .results { margin-top: 20px; }
         .results a { display: inline-block; margin-top: 10px; padding: 10px 20px; background: #28a745; color: white; text-decoration: none; border-radius: 5px; }
+        .result-rows { margin-top: 15px; max-height: 300px; overflow-y: auto; font-size: 13px; direction: ltr; text-align: left; }
+        .result-rows div { padding: 3px 0; border-bottom: 1px solid #eee; word-break: break-all; }
+        .result-rows .failed { color: #c82333; }
     </style>
 </head>
 <body>
@@ -312,11 +634,14 @@ if __name__ == '__main__':
         </form>
         
         <div id="status" class="status" style="display: none;"></div>
+        <div id="resultRows" class="result-rows"></div>
     </div>
 
     <script>
         let currentJobId = null;
         let statusInterval = null;
+        let eventSource = null;
+        let streamErrors = 0;
 
         document.getElementById('urlForm').addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -341,7 +666,8 @@ if __name__ == '__main__':
                 if (response.ok) {
                     currentJobId = result.job_id;
                     document.getElementById('status').style.display = 'block';
-                    startStatusCheck();
+                    document.getElementById('resultRows').innerHTML = '';
+                    startProgressStream();
                 } else {
                     alert('خطا: ' + result.error);
                 }
@@ -350,6 +676,54 @@ if __name__ == '__main__':
             }
         });
 
+        function stopProgressUpdates() {
+            if (eventSource) {
+                eventSource.close();
+                eventSource = null;
+            }
+            if (statusInterval) {
+                clearInterval(statusInterval);
+                statusInterval = null;
+            }
+        }
+
+        function startProgressStream() {
+            stopProgressUpdates();
+            
+            // Polling is only used when the browser or a proxy can't keep the stream open
+            if (!window.EventSource) {
+                startStatusCheck();
+                return;
+            }
+            
+            streamErrors = 0;
+            eventSource = new EventSource(`/events/${currentJobId}`);
+            
+            eventSource.addEventListener('progress', (e) => {
+                streamErrors = 0;
+                updateStatus(JSON.parse(e.data));
+            });
+            
+            eventSource.addEventListener('result', (e) => {
+                streamErrors = 0;
+                appendResultRow(JSON.parse(e.data));
+            });
+            
+            eventSource.addEventListener('done', (e) => {
+                updateStatus(JSON.parse(e.data));
+                stopProgressUpdates();
+            });
+            
+            eventSource.onerror = () => {
+                // EventSource reconnects on its own with Last-Event-ID; give up after repeated failures
+                streamErrors += 1;
+                if (eventSource.readyState === EventSource.CLOSED || streamErrors >= 3) {
+                    stopProgressUpdates();
+                    startStatusCheck();
+                }
+            };
+        }
+
         function startStatusCheck() {
             if (statusInterval) clearInterval(statusInterval);
             
@@ -369,6 +743,13 @@ if __name__ == '__main__':
             }, 2000);
         }
 
+        function appendResultRow(result) {
+            const row = document.createElement('div');
+            row.className = result.status;
+            row.textContent = `${result.original_url} → ${result.shortened_url}`;
+            document.getElementById('resultRows').appendChild(row);
+        }
+
         function updateStatus(status) {
             const statusDiv = document.getElementById('status');
             statusDiv.className = `status ${status.status}`;
@@ -389,7 +770,13 @@ if __name__ == '__main__':
                     <div class="results">
                         <p>✅ موفق: ${status.successful_urls}</p>
                         <p>❌ ناموفق: ${status.failed_urls}</p>
-                        <a href="/download/${currentJobId}">📥 دانلود نتایج CSV</a>
+                        <a href="/download/${currentJobId}?gzip=1">📥 دانلود نتایج CSV</a>
+                    </div>
+                `;
+            } else if (status.processed_urls > 0) {
+                html += `
+                    <div class="results">
+                        <a href="/download/${currentJobId}?partial=1&gzip=1">📥 دانلود نتایج تا این لحظه</a>
                     </div>
                 `;
             }
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared work queue for multi-node runs
+Links live in a SQLite file on shared storage; workers claim them with expiring leases
+"""
+
+import os
+import sys
+import csv
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+from utils import canonicalize_url, DEFAULT_URL_NORMALIZATIONS
+
+# Keyed by the canonical URL so spelling variants of one link are queued once; url keeps the first spelling
+LINKS_TABLE = """
+CREATE TABLE IF NOT EXISTS links (
+    url_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    shortened_url TEXT,
+    status TEXT,
+    account TEXT,
+    updated_at REAL
+)
+"""
+
+LINKS_INDEX = "CREATE INDEX IF NOT EXISTS idx_links_state ON links (state, lease_expires)"
+
+LINK_COLUMNS = 'url, state, attempts, lease_owner, lease_expires, shortened_url, status, account, updated_at'
+
+SCHEMA = LINKS_TABLE + ";\n" + LINKS_INDEX + """;
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    hostname TEXT,
+    started_at REAL,
+    last_heartbeat REAL
+);
+"""
+
+def default_worker_id():
+    """Unique id for this process on this machine"""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+class SQLiteWorkQueue:
+    """Link queue with leases, heartbeats and automatic reclaiming of expired leases
+    
+    Every node sharing a queue must use the same url_normalizations, or they will
+    disagree about which links are the same.
+    """
+    
+    def __init__(self, path, lease_seconds=300, busy_timeout=60, url_normalizations=DEFAULT_URL_NORMALIZATIONS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.busy_timeout = busy_timeout
+        self.url_normalizations = url_normalizations
+        self.local = threading.local()
+        
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+    
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            self.local.conn = conn
+        return conn
+    
+    def _transaction(self):
+        return _Transaction(self._connection())
+    
+    def link_key(self, url):
+        return canonicalize_url(url, self.url_normalizations)
+    
+    def _migrate(self):
+        """Re-key a queue created when links were keyed by the raw URL"""
+        with self._transaction() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(links)")]
+            if 'url_key' in columns:
+                return
+            
+            conn.execute("ALTER TABLE links RENAME TO links_raw")
+            conn.execute(LINKS_TABLE)
+            rows = conn.execute(f"SELECT {LINK_COLUMNS} FROM links_raw ORDER BY rowid").fetchall()
+            # Variants that now share a key collapse into one row, keeping a finished one if there is any
+            conn.executemany(
+                f"INSERT INTO links (url_key, {LINK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url_key) DO UPDATE SET url = excluded.url, state = excluded.state, attempts = excluded.attempts, "
+                "lease_owner = excluded.lease_owner, lease_expires = excluded.lease_expires, "
+                "shortened_url = excluded.shortened_url, status = excluded.status, "
+                "account = excluded.account, updated_at = excluded.updated_at "
+                "WHERE excluded.state = 'done' AND links.state != 'done'",
+                ((self.link_key(row[0]),) + tuple(row) for row in rows)
+            )
+            conn.execute("DROP TABLE links_raw")
+            conn.execute(LINKS_INDEX)
+    
+    def add_links(self, links):
+        """Enqueue links; ones already in the store, in any spelling, are left alone"""
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO links (url_key, url, updated_at) VALUES (?, ?, ?)",
+                ((self.link_key(link), link, now) for link in links)
+            )
+            return conn.total_changes - before
+    
+    def claim(self, worker_id, count):
+        """Lease up to count pending links, reclaiming expired leases first"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE links SET state = 'pending', lease_owner = NULL, lease_expires = NULL "
+                "WHERE state = 'leased' AND lease_expires < ?",
+                (now,)
+            )
+            rows = conn.execute(
+                "SELECT url_key, url, attempts FROM links WHERE state = 'pending' ORDER BY rowid LIMIT ?",
+                (count,)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE links SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE url_key = ?",
+                ((worker_id, now + self.lease_seconds, now, url_key) for url_key, _, _ in rows)
+            )
+        return [(url, attempts + 1) for _, url, attempts in rows]
+    
+    def heartbeat(self, worker_id):
+        """Extend this worker's leases and mark it alive"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE links SET lease_expires = ? WHERE state = 'leased' AND lease_owner = ?",
+                (now + self.lease_seconds, worker_id)
+            )
+            conn.execute(
+                "INSERT INTO workers (worker_id, hostname, started_at, last_heartbeat) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_heartbeat = excluded.last_heartbeat",
+                (worker_id, socket.gethostname(), now, now)
+            )
+    
+    def complete(self, worker_id, url, shortened_url, success, account=None):
+        """Store a link's result; the first completion wins if a lease was reclaimed meanwhile"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE links SET state = 'done', lease_owner = ?, lease_expires = NULL, "
+                "shortened_url = ?, status = ?, account = ?, updated_at = ? "
+                "WHERE url_key = ? AND state != 'done'",
+                (worker_id, shortened_url, 'SUCCESS' if success else 'FAILED', account, time.time(),
+                 self.link_key(url))
+            )
+    
+    def release(self, worker_id, url):
+        """Give a leased link back so any worker can retry it"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE links SET state = 'pending', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE url_key = ? AND state = 'leased' AND lease_owner = ?",
+                (time.time(), self.link_key(url), worker_id)
+            )
+    
+    def stats(self):
+        """Link counts by state"""
+        rows = self._connection().execute("SELECT state, COUNT(*) FROM links GROUP BY state").fetchall()
+        counts = {'pending': 0, 'leased': 0, 'done': 0}
+        counts.update(dict(rows))
+        return counts
+    
+    def is_finished(self):
+        counts = self.stats()
+        return counts['pending'] == 0 and counts['leased'] == 0
+    
+    def iter_results(self):
+        """Yield finished rows in queue order"""
+        cursor = self._connection().execute(
+            "SELECT updated_at, url, shortened_url, status, account, lease_owner FROM links "
+            "WHERE state = 'done' ORDER BY rowid"
+        )
+        for updated_at, url, shortened_url, status, account, worker_id in cursor:
+            yield {
+                'timestamp': datetime.fromtimestamp(updated_at).isoformat(),
+                'original_url': url,
+                'shortened_url': shortened_url or 'FAILED',
+                'status': status,
+                'account': account,
+                'worker': worker_id
+            }
+    
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so concurrent claimers never lease the same link"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+class QueueWorker:
+    """Runs a URLShortener against the shared queue until no work is left"""
+    
+    def __init__(self, config, logger, queue, worker_id=None, poll_interval=15):
+        self.config = config
+        self.logger = logger
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+    
+    def _heartbeat_loop(self):
+        interval = max(self.queue.lease_seconds / 3, 1)
+        while not self.stop_event.wait(interval):
+            try:
+                self.queue.heartbeat(self.worker_id)
+            except Exception as e:
+                self.logger.warning(f"Queue heartbeat failed: {str(e)}")
+    
+    def run(self):
+        """Claim, shorten and complete links; returns True if any link succeeded"""
+        from url_shortener import URLShortener
+        
+        shortener = URLShortener(self.config, self.logger)
+        successful = 0
+        failed = 0
+        
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        try:
+            if not shortener.setup_driver() or not shortener.login():
+                return False
+            
+            # Every node may seed the same files; links already in the store are skipped
+            if self.config.input_files:
+                links = shortener.read_links_from_files()
+                if links:
+                    added = self.queue.add_links(links)
+                    self.logger.info(f"Added {added} new links to the shared queue")
+            
+            self.queue.heartbeat(self.worker_id)
+            heartbeat_thread.start()
+            self.logger.info(f"Worker {self.worker_id} joined queue {self.queue.path}")
+            
+            while True:
+                claimed = self.queue.claim(self.worker_id, self.config.batch_size)
+                if not claimed:
+                    if self.queue.is_finished():
+                        break
+                    # Other nodes still hold leases; wait in case they expire or get released
+                    time.sleep(self.poll_interval)
+                    continue
+                
+                recycle_reason = shortener.get_recycle_reason()
+                if recycle_reason and not shortener.recycle_driver(recycle_reason):
+                    for url, _ in claimed:
+                        self.queue.release(self.worker_id, url)
+                    break
+                
+                for index, (url, attempt) in enumerate(claimed):
+                    if attempt > self.config.max_link_attempts:
+                        self.queue.complete(self.worker_id, url, None, False, shortener.account_name)
+                        failed += 1
+                        continue
+                    
+                    # The breaker may trip partway through a batch; the heartbeat keeps our leases while we wait
+                    shortener.wait_if_paused()
+                    outcome, shortened = shortener.process_link(url, attempt)
+                    
+                    if outcome == 'retry':
+                        self.queue.release(self.worker_id, url)
+                        continue
+                    
+                    if outcome == 'stop':
+                        for pending_url, _ in claimed[index:]:
+                            self.queue.release(self.worker_id, pending_url)
+                        self.logger.error("Session could not be recovered, leaving the queue")
+                        return successful > 0
+                    
+                    self.queue.complete(self.worker_id, url, shortened, outcome == 'success',
+                                        shortener.account_name)
+                    if outcome == 'success':
+                        successful += 1
+                    else:
+                        failed += 1
+                    
+                    time.sleep(self.config.delay)
+                
+                counts = self.queue.stats()
+                self.logger.info(f"Queue: {counts['done']} done, {counts['leased']} leased, "
+                                 f"{counts['pending']} pending - this worker: {successful} ok, {failed} failed")
+                shortener.write_metrics()
+            
+            self.logger.info(f"Queue drained: {successful} successful, {failed} failed on this worker")
+            return successful > 0
+        
+        finally:
+            self.stop_event.set()
+            shortener.cleanup()
+            shortener.write_metrics()
+            shortener.close_outputs()
+
+def main():
+    """Inspect or export a shared queue"""
+    parser = argparse.ArgumentParser(description='Shared URL shortener work queue')
+    parser.add_argument('command', choices=['status', 'export'], help='Show counts or export results as CSV')
+    parser.add_argument('queue', help='Path to the queue SQLite file')
+    parser.add_argument('--output', help='CSV file for export (default: stdout)')
+    args = parser.parse_args()
+    
+    queue = SQLiteWorkQueue(args.queue)
+    
+    if args.command == 'status':
+        counts = queue.stats()
+        print(f"pending: {counts['pending']}, leased: {counts['leased']}, done: {counts['done']}")
+        return 0
+    
+    fieldnames = ['timestamp', 'original_url', 'shortened_url', 'status', 'account', 'worker']
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in queue.iter_results():
+            writer.writerow(row)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())